@@ -1,59 +1,339 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import numpy as np
 import pandas as pd
-import joblib
+import asyncio
+import json
+import os
+import tempfile
+import time
 from io import StringIO
 
+from inference import (
+    COLONNES_UTILES, TAILLE_MORCEAU, ColonnesManquantes, scorer, construire_reponse, resultats_lignes, resume,
+    copier_flux, lire_entete, flux_predictions, charger_imputation, imputer
+)
+from jobs import GestionnaireJobs, FileJobsPleine, TAILLE_MAX_UPLOAD, TERMINE
+from microbatch import MicroBatcher
+from live_monitoring import JournalPredictions
+from cache import CacheResultats
+from model_loader import CHEMIN_MODELE
+from registry import REGISTRE, mesurer, routeur_modeles
+from metrics import (
+    DUREE_REQUETE, OCTETS, erreur_validation, etape, observer_inference, reponse_erreur, routeur_metrics
+)
+
 app = FastAPI()
+app.include_router(routeur_metrics)
+app.add_exception_handler(RequestValidationError, erreur_validation)
+app.include_router(routeur_modeles)
+
+SERVICE = "prediction"
+
+# Modèles (principal, candidats A/B, ombre) chargés en arrière-plan au démarrage
+# et rechargeables à chaud : voir registry.py
+
+# Réponses déjà calculées, par contenu de fichier et version du modèle
+cache_resultats = CacheResultats(CHEMIN_MODELE)
+
+# Jobs de scoring asynchrones pour les gros fichiers, sur le modèle principal
+# du registre (sans routage A/B)
+gestionnaire_jobs = GestionnaireJobs(REGISTRE.chemin_principal)
+
+# Journal binaire des prédictions, lu par GET /monitoring/live
+journal = JournalPredictions()
+
+
+def scorer_et_journaliser(X, service, version=None):
+    # La version est prise une fois : un rechargement pendant le scoring ne l'affecte pas
+    version = version or REGISTRE.choisir()
+    debut = time.perf_counter()
+    labels, proba_0, proba_1 = mesurer(version, "servi", scorer, X)
+    observer_inference(service, time.perf_counter() - debut, len(labels))
+    journal.ajouter(X, labels)
+    REGISTRE.ombre(X, labels, version, scorer)
+    return labels, proba_0, proba_1
+
+
+# Regroupement des requêtes unitaires en micro-lots
+micro_batcher = MicroBatcher(lambda X: scorer_et_journaliser(X, "predict_json"))
+
+
+class Billet(BaseModel):
+    # Valeurs finies uniquement (JSON accepte NaN et Infinity) ;
+    # margin_low absente est imputée par la médiane de référence
+    margin_low: Optional[float] = Field(None, allow_inf_nan=False)
+    margin_up: float = Field(allow_inf_nan=False)
+    length: float = Field(allow_inf_nan=False)
+
+
+@app.on_event("startup")
+async def charger_modele():
+    # Médianes de référence : quelques millisecondes, chargées avant la première requête
+    charger_imputation()
+    # Sans attendre : /health répond tout de suite, /ready passe à 200 une fois chargé
+    asyncio.get_running_loop().run_in_executor(None, REGISTRE.version_principale)
+
+
+@app.on_event("startup")
+async def demarrer_surveillance():
+    # Rechargements demandés à un autre worker, artefacts ou configuration modifiés
+    REGISTRE.demarrer_surveillance()
+
+
+@app.on_event("startup")
+def demarrer_jobs():
+    gestionnaire_jobs.demarrer()
+
+
+@app.on_event("startup")
+async def demarrer_micro_batcher():
+    await micro_batcher.demarrer()
+
+
+@app.on_event("shutdown")
+def arreter_jobs():
+    gestionnaire_jobs.arreter()
+
+
+@app.on_event("shutdown")
+def fermer_journal():
+    journal.fermer()
+
+
+@app.on_event("shutdown")
+async def arreter_micro_batcher():
+    await micro_batcher.arreter()
 
-# Charger le modèle
-pipeline_rf = joblib.load("model_detection_faux_billets.pkl")
 
 @app.post("/prediction/")
-async def predict(fichier: UploadFile = File(...)):
+async def predict(
+    fichier: UploadFile = File(...),
+    format: str = Query("records", pattern="^(records|columns)$")
+):
+    debut = time.perf_counter()
     try:
         # Lecture du fichier
-        contenu = await fichier.read()
-        text_data = contenu.decode("utf-8")
+        with etape(SERVICE, "lecture"):
+            contenu = await fichier.read()
+        OCTETS.incrementer(len(contenu), service=SERVICE)
+
+        # Modèle qui répond (routage A/B), choisi avant le cache pour en faire partie de la clé
+        version = await run_in_threadpool(REGISTRE.choisir)
+
+        # Fichier déjà scoré avec ce modèle : réponse servie telle quelle
+        with etape(SERVICE, "cache"):
+            cle = await run_in_threadpool(
+                cache_resultats.cle, contenu, "prediction", format, version.nom, version.empreinte,
+                charger_imputation().empreinte
+            )
+            corps = await run_in_threadpool(cache_resultats.lire, cle)
+        if corps is not None:
+            return Response(corps, media_type="application/json")
+
+        with etape(SERVICE, "decodage"):
+            text_data = contenu.decode("utf-8")
 
         # Détection du séparateur
-        sep = ";" if ";" in text_data else ","
-        df = pd.read_csv(StringIO(text_data), sep=sep)
+        with etape(SERVICE, "separateur"):
+            sep = ";" if ";" in text_data else ","
+
+        with etape(SERVICE, "read_csv"):
+            df = pd.read_csv(StringIO(text_data), sep=sep)
 
         # Colonnes nécessaires
-        colonnes_utiles = ["margin_low", "margin_up", "length"]
+        colonnes_utiles = COLONNES_UTILES
         colonnes_manquantes = [col for col in colonnes_utiles if col not in df.columns]
 
         if colonnes_manquantes:
-            return {"error": f"Colonnes manquantes : {', '.join(colonnes_manquantes)}"}
-
-        # Préparation des données
-        df_model = df[colonnes_utiles].copy()
-
-        # Imputation uniquement si des NaN existent
-        if df_model["margin_low"].isnull().any():
-            df_model["margin_low"] = df_model["margin_low"].fillna(df_model["margin_low"].median())
-
-        # Prédictions
-        predictions = pipeline_rf.predict(df_model)
-        proba_predictions_1 = pipeline_rf.predict_proba(df_model)[:, 1]
-        proba_predictions_0 = pipeline_rf.predict_proba(df_model)[:, 0]
-
-
-        df_model["predictions"] = predictions
-        df_model["probabilités_0"] = [round(p, 2) for p in proba_predictions_0]
-        df_model["probabilités_1"] = [round(p, 2) for p in proba_predictions_1]
-        # Résumé
-        counts = pd.Series(predictions).value_counts().to_dict()
-        summary = {
-            "vrai_billet": counts.get(0, 0),
-            "faux_billet": counts.get(1, 0),
-            "total": len(predictions)
-        }
+            raise ColonnesManquantes(f"Colonnes manquantes : {', '.join(colonnes_manquantes)}")
+
+        # Préparation des données : imputation de référence, indépendante du fichier
+        with etape(SERVICE, "imputation"):
+            df_model = imputer(df[colonnes_utiles])
+
+        # Prédictions : un seul passage de la forêt pour labels et probabilités
+        predictions, proba_predictions_0, proba_predictions_1 = await run_in_threadpool(
+            scorer_et_journaliser, df_model, SERVICE, version
+        )
+
+        # Réponse construite colonne par colonne, sérialisée une fois pour le cache
+        with etape(SERVICE, "serialisation"):
+            reponse = construire_reponse(
+                df_model, predictions, proba_predictions_0, proba_predictions_1, format=format
+            )
+            corps = json.dumps(reponse, ensure_ascii=False).encode("utf-8")
+        await run_in_threadpool(cache_resultats.ecrire, cle, corps)
+        return Response(corps, media_type="application/json")
+
+    except Exception as e:
+        return reponse_erreur(SERVICE, e)
+
+    finally:
+        DUREE_REQUETE.observer(time.perf_counter() - debut, service=SERVICE)
+
 
+@app.post("/prediction/stream")
+async def predict_stream(
+    fichier: UploadFile = File(...),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    taille_morceau: int = Query(TAILLE_MORCEAU, gt=0, le=1_000_000)
+):
+    """
+    Variante en flux de /prediction/ pour les très gros fichiers.
+
+    Le fichier n'est jamais lu d'un bloc : il est recopié sur disque par
+    blocs, analysé par morceaux et chaque morceau est renvoyé dès qu'il est
+    scoré, la mémoire reste donc bornée par taille_morceau.
+    """
+    # Copie propre à la réponse : l'upload est fermé dès le retour de la route,
+    # avant la fin du flux
+    copie = tempfile.TemporaryFile()
+    try:
+        await run_in_threadpool(copier_flux, fichier.file, copie)
+        sep, colonnes_manquantes = await run_in_threadpool(lire_entete, copie)
+    except Exception as e:
+        copie.close()
+        return reponse_erreur("prediction_stream", e)
+
+    if colonnes_manquantes:
+        copie.close()
+        return reponse_erreur(
+            "prediction_stream",
+            ColonnesManquantes(f"Colonnes manquantes : {', '.join(colonnes_manquantes)}")
+        )
+
+    def generer():
+        # Un seul modèle pour tout le flux ; métriques, journal et ombre comme /prediction/
+        version = REGISTRE.choisir()
+        with copie:
+            yield from flux_predictions(
+                lambda X: scorer_et_journaliser(X, "prediction_stream", version), copie, sep,
+                format=format, taille_morceau=taille_morceau
+            )
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    # Générateur synchrone : Starlette l'itère dans son threadpool,
+    # la boucle d'événements n'est pas bloquée par pandas/sklearn
+    return StreamingResponse(generer(), media_type=media_type)
+
+
+def _copier_upload(fichier, chemin):
+    with open(chemin, "wb") as destination:
+        copier_flux(fichier.file, destination)
+    return os.path.getsize(chemin)
+
+
+@app.post("/jobs", status_code=202)
+async def creer_job(fichier: UploadFile = File(...)):
+    """
+    Dépose un fichier et renvoie immédiatement un identifiant de job.
+
+    Le scoring se fait dans le pool de processus ; l'état se consulte sur
+    GET /jobs/{job_id}.
+    """
+    if fichier.size is not None and fichier.size > TAILLE_MAX_UPLOAD:
+        return JSONResponse(status_code=413, content={"error": "Fichier trop volumineux"})
+
+    try:
+        job_id = await run_in_threadpool(gestionnaire_jobs.nouveau_job)
+    except FileJobsPleine as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
+
+    try:
+        taille = await run_in_threadpool(
+            _copier_upload, fichier, gestionnaire_jobs.chemin_entree(job_id)
+        )
+        if taille > TAILLE_MAX_UPLOAD:
+            await run_in_threadpool(gestionnaire_jobs.abandonner, job_id)
+            return JSONResponse(status_code=413, content={"error": "Fichier trop volumineux"})
+
+        await run_in_threadpool(gestionnaire_jobs.soumettre, job_id)
+
+    except FileJobsPleine as e:
+        await run_in_threadpool(gestionnaire_jobs.abandonner, job_id)
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    except Exception as e:
+        await run_in_threadpool(gestionnaire_jobs.abandonner, job_id)
+        return reponse_erreur("jobs", e)
+
+    return {"job_id": job_id, "statut": "en_attente", "url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def statut_job(job_id: str):
+    job = await run_in_threadpool(gestionnaire_jobs.statut, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job inconnu"})
+    return job
+
+
+@app.get("/jobs/{job_id}/resultat")
+async def resultat_job(job_id: str):
+    job = await run_in_threadpool(gestionnaire_jobs.statut, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job inconnu"})
+    if job["statut"] != TERMINE:
+        return JSONResponse(status_code=409, content={"error": f"Job {job['statut']}"})
+
+    return FileResponse(
+        gestionnaire_jobs.chemin_resultat(job_id),
+        media_type="text/csv",
+        filename=f"resultats_predictions_{job_id}.csv"
+    )
+
+
+def _matrice(billets):
+    # None -> NaN, puis imputation de référence : même résultat seul ou en lot
+    return imputer(np.array(
+        [[billet.margin_low, billet.margin_up, billet.length] for billet in billets],
+        dtype=np.float64
+    ).reshape(-1, len(COLONNES_UTILES)))
+
+
+@app.post("/predict/one")
+async def predict_one(billet: Billet):
+    """Prédiction d'un seul billet, sans multipart ni pandas."""
+    try:
+        X = _matrice([billet])
+        labels, proba_0, proba_1 = await micro_batcher.soumettre(X)
+        return resultats_lignes(X, labels, proba_0, proba_1)[0]
+    except Exception as e:
+        return reponse_erreur("predict_json", e)
+
+
+@app.post("/predict/batch")
+async def predict_batch(billets: List[Billet]):
+    """Prédiction d'un tableau JSON de billets, même format que /prediction/."""
+    if not billets:
+        return {"predictions": [], "summary": resume(np.array([]))}
+
+    try:
+        X = _matrice(billets)
+        labels, proba_0, proba_1 = await micro_batcher.soumettre(X)
         return {
-            "predictions": df_model.to_dict(orient="records"),
-            "summary": summary
+            "predictions": resultats_lignes(X, labels, proba_0, proba_1),
+            "summary": resume(labels)
         }
-
     except Exception as e:
-        return {"error": str(e)}
+        return reponse_erreur("predict_json", e)
+
+
+@app.get("/cache/stats")
+async def stats_cache():
+    return cache_resultats.stats()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    etat = REGISTRE.etat()
+    return JSONResponse(status_code=200 if etat["pret"] else 503, content=etat)
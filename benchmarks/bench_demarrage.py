@@ -0,0 +1,109 @@
+"""
+Temps de démarrage et mémoire par worker de l'API, moteur "sklearn"
+(pickle chargé avec mmap_mode="r", défaut) contre "compiled" (bundle en mmap).
+
+Lance uvicorn avec --workers N, attend que GET /ready réponde 200 sur
+tous les workers, puis relève pour chaque worker le RSS et le PSS
+(/proc/<pid>/smaps_rollup, Linux) : le PSS répartit les pages partagées
+entre les processus et montre donc le gain du mmap.
+
+Usage :
+    python benchmarks/bench_demarrage.py --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from donnees_synthetiques import RACINE
+from suite import port_libre
+
+
+def memoire(pid):
+    """(RSS, PSS) en Mo d'après /proc."""
+    resultat = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for ligne in f:
+                champ = ligne.split(":")[0]
+                if champ in ("Rss", "Pss"):
+                    resultat[champ] = round(int(ligne.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return resultat.get("Rss"), resultat.get("Pss")
+
+
+def enfants(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def attendre_pret(url, processus, workers, delai_max=180):
+    """Attend /ready = 200 ; chaque worker répond à son tour, on exige workers réponses d'affilée."""
+    debut = time.perf_counter()
+    consecutifs = 0
+    while time.perf_counter() - debut < delai_max:
+        if processus.poll() is not None:
+            raise RuntimeError(f"uvicorn s'est arrêté (code {processus.returncode})")
+        try:
+            with urllib.request.urlopen(url + "/ready", timeout=1) as reponse:
+                consecutifs = consecutifs + 1 if reponse.status == 200 else 0
+        except (urllib.error.URLError, ConnectionError, OSError):
+            consecutifs = 0
+        if consecutifs >= workers * 2:
+            return time.perf_counter() - debut
+        time.sleep(0.02)
+    raise RuntimeError("le service n'est pas prêt à temps")
+
+
+def mesurer(backend, workers):
+    port = port_libre()
+    env = dict(os.environ, INFERENCE_BACKEND=backend, JOURNAL_ACTIF="0")
+    processus = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=RACINE, env=env
+    )
+    try:
+        demarrage = attendre_pret(f"http://127.0.0.1:{port}", processus, workers)
+        mesures = [memoire(pid) for pid in enfants(processus.pid)]
+        rss = [m[0] for m in mesures if m[0] is not None]
+        pss = [m[1] for m in mesures if m[1] is not None]
+        return {
+            "backend": backend,
+            "workers": workers,
+            "pret_s": round(demarrage, 3),
+            "rss_moyen_mo": round(sum(rss) / len(rss), 1) if rss else None,
+            "pss_moyen_mo": round(sum(pss) / len(pss), 1) if pss else None,
+            "pss_total_mo": round(sum(pss), 1) if pss else None
+        }
+    finally:
+        processus.terminate()
+        processus.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backends", nargs="+", default=["sklearn", "compiled"])
+    args = parser.parse_args()
+
+    # Le bundle est construit une fois avant la mesure (même chose qu'au déploiement)
+    sys.path.insert(0, RACINE)
+    os.chdir(RACINE)
+    from model_loader import CHEMIN_MODELE, bundle_a_jour
+    bundle_a_jour(CHEMIN_MODELE)
+
+    for backend in args.backends:
+        print(json.dumps(mesurer(backend, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Forêt compilée (forest.py) contre predict_proba de scikit-learn :
+vérification sur billets.csv, débit et pic mémoire.
+
+Le moteur par défaut reste scikit-learn (INFERENCE_BACKEND=sklearn) ; la
+dernière ligne indique si la forêt compilée est plus rapide sur cette
+machine pour toutes les tailles mesurées.
+
+Usage :
+    python benchmarks/bench_foret.py --tailles 1000 100000 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import joblib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from donnees_synthetiques import RACINE, generer_donnees  # noqa: E402
+from forest import ForetCompilee, verifier  # noqa: E402
+from inference import donnees_reference  # noqa: E402
+
+
+def mesurer(fonction, X, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(X)
+        durees.append(time.perf_counter() - debut)
+
+    tracemalloc.start()
+    fonction(X)
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(durees), pic
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repetitions", type=int, default=3)
+    args = parser.parse_args()
+
+    pipeline_rf = joblib.load(os.path.join(RACINE, "model_detection_faux_billets.pkl"))
+    foret = ForetCompilee.depuis_pipeline(pipeline_rf)
+
+    identique, ecart = verifier(foret, pipeline_rf, donnees_reference(os.path.join(RACINE, "billets.csv")))
+    print(json.dumps({"billets.csv": {"identique_bit_a_bit": identique, "ecart_max": ecart}}))
+
+    gains = []
+    for n in args.tailles:
+        X = generer_donnees(n, graine=n)
+        duree_sk, pic_sk = mesurer(pipeline_rf.predict_proba, X, args.repetitions)
+        duree_c, pic_c = mesurer(foret.predict_proba, X, args.repetitions)
+        identique, ecart = verifier(foret, pipeline_rf, X)
+        gains.append(duree_sk / duree_c)
+        print(json.dumps({
+            "lignes": n,
+            "sklearn_lignes_s": round(n / duree_sk),
+            "compile_lignes_s": round(n / duree_c),
+            "gain": round(duree_sk / duree_c, 2),
+            "sklearn_pic_mo": round(pic_sk / 1e6, 1),
+            "compile_pic_mo": round(pic_c / 1e6, 1),
+            "identique_bit_a_bit": identique,
+            "ecart_max": ecart
+        }))
+
+    print(json.dumps({
+        "compile_plus_rapide": all(gain > 1 for gain in gains),
+        "gain_min": round(min(gains), 2),
+        "gain_max": round(max(gains), 2)
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark de /prediction/ : ancien chemin (3 passages de la forêt,
+arrondis en compréhension de liste, to_dict) contre le chemin vectorisé.
+
+Usage :
+    python benchmarks/bench_prediction.py --tailles 1000 100000 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from donnees_synthetiques import RACINE, generer_donnees  # noqa: E402
+from inference import scorer, construire_reponse  # noqa: E402
+
+
+def ancien_chemin(pipeline_rf, df_model):
+    predictions = pipeline_rf.predict(df_model)
+    proba_predictions_1 = pipeline_rf.predict_proba(df_model)[:, 1]
+    proba_predictions_0 = pipeline_rf.predict_proba(df_model)[:, 0]
+
+    df_model["predictions"] = predictions
+    df_model["probabilités_0"] = [round(p, 2) for p in proba_predictions_0]
+    df_model["probabilités_1"] = [round(p, 2) for p in proba_predictions_1]
+    counts = pd.Series(predictions).value_counts().to_dict()
+    summary = {
+        "vrai_billet": counts.get(0, 0),
+        "faux_billet": counts.get(1, 0),
+        "total": len(predictions)
+    }
+    return {"predictions": df_model.to_dict(orient="records"), "summary": summary}
+
+
+def nouveau_chemin(pipeline_rf, df_model, format):
+    labels, proba_0, proba_1 = scorer(pipeline_rf, df_model)
+    return construire_reponse(df_model, labels, proba_0, proba_1, format=format)
+
+
+def chronometrer(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        corps = fonction()
+        # Sérialisation telle que FastAPI la fait pour un dict retourné
+        json.dumps(jsonable_encoder(corps))
+        durees.append(time.perf_counter() - debut)
+    return min(durees)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repetitions", type=int, default=3)
+    args = parser.parse_args()
+
+    pipeline_rf = joblib.load(os.path.join(RACINE, "model_detection_faux_billets.pkl"))
+    resultats = []
+
+    for n in args.tailles:
+        df = generer_donnees(n)
+        ancien = chronometrer(lambda: ancien_chemin(pipeline_rf, df.copy()), args.repetitions)
+        records = chronometrer(lambda: nouveau_chemin(pipeline_rf, df.copy(), "records"), args.repetitions)
+        columns = chronometrer(lambda: nouveau_chemin(pipeline_rf, df.copy(), "columns"), args.repetitions)
+        resultats.append({
+            "lignes": n,
+            "ancien_s": round(ancien, 4),
+            "records_s": round(records, 4),
+            "columns_s": round(columns, 4),
+            "gain_records": round(ancien / records, 2),
+            "gain_columns": round(ancien / columns, 2)
+        })
+        print(json.dumps(resultats[-1]))
+
+
+if __name__ == "__main__":
+    main()
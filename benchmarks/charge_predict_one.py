@@ -0,0 +1,90 @@
+"""
+Test de charge de POST /predict/one (ou /predict/batch).
+
+Lance --concurrence clients en parallèle qui envoient --requetes requêtes
+au total, puis affiche p50/p99 et le débit.
+
+Usage :
+    uvicorn api:app --port 8000
+    python benchmarks/charge_predict_one.py --url http://127.0.0.1:8000 --concurrence 64
+"""
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def billet_aleatoire(rng):
+    return {
+        "margin_low": round(rng.uniform(3.0, 6.5), 2),
+        "margin_up": round(rng.uniform(2.5, 3.8), 2),
+        "length": round(rng.uniform(109.0, 114.5), 2)
+    }
+
+
+def envoyer(url, corps):
+    requete = urllib.request.Request(
+        url, data=corps, headers={"Content-Type": "application/json"}, method="POST"
+    )
+    debut = time.perf_counter()
+    try:
+        with urllib.request.urlopen(requete) as reponse:
+            reponse.read()
+            statut = reponse.status
+    except urllib.error.HTTPError as e:
+        statut = e.code
+    return time.perf_counter() - debut, statut
+
+
+def percentile(valeurs, q):
+    valeurs = sorted(valeurs)
+    indice = min(int(round(q / 100 * (len(valeurs) - 1))), len(valeurs) - 1)
+    return valeurs[indice]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--route", default="/predict/one", choices=["/predict/one", "/predict/batch"])
+    parser.add_argument("--taille-lot", type=int, default=10, help="billets par requête pour /predict/batch")
+    parser.add_argument("--requetes", type=int, default=5000)
+    parser.add_argument("--concurrence", type=int, default=32)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    url = args.url.rstrip("/") + args.route
+    if args.route == "/predict/one":
+        corps = [json.dumps(billet_aleatoire(rng)).encode() for _ in range(args.requetes)]
+    else:
+        corps = [
+            json.dumps([billet_aleatoire(rng) for _ in range(args.taille_lot)]).encode()
+            for _ in range(args.requetes)
+        ]
+
+    # Échauffement (connexion, premiers appels du modèle)
+    for c in corps[:10]:
+        envoyer(url, c)
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrence) as pool:
+        resultats = list(pool.map(lambda c: envoyer(url, c), corps))
+    duree = time.perf_counter() - debut
+
+    latences = [latence for latence, _ in resultats]
+    erreurs = sum(1 for _, statut in resultats if statut != 200)
+    print(json.dumps({
+        "route": args.route,
+        "requetes": args.requetes,
+        "concurrence": args.concurrence,
+        "erreurs": erreurs,
+        "debit_req_s": round(args.requetes / duree, 1),
+        "p50_ms": round(percentile(latences, 50) * 1000, 2),
+        "p99_ms": round(percentile(latences, 99) * 1000, 2)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare deux fichiers de résultats de benchmarks/suite.py.
+
+Affiche, pour chaque scénario commun (mode, service, taille, concurrence),
+le rapport nouveau / ancien des métriques et signale les régressions
+au-delà de --seuil. Code de sortie 1 s'il y en a.
+
+Usage :
+    python benchmarks/comparer.py benchmarks/resultats/abc1234.json benchmarks/resultats/def5678.json
+"""
+import argparse
+import json
+import sys
+
+# Métrique -> True si une valeur plus grande est meilleure
+METRIQUES = {
+    "debit_lignes_s": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "rss_max_mo": False,
+    "demarrage_s": False
+}
+
+
+def charger(chemin):
+    with open(chemin) as f:
+        rapport = json.load(f)
+    scenarios = {
+        (r["mode"], r["service"], r["lignes"], r["concurrence"]): r for r in rapport["resultats"]
+    }
+    return rapport["meta"], scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ancien")
+    parser.add_argument("nouveau")
+    parser.add_argument("--seuil", type=float, default=0.10, help="dégradation relative tolérée")
+    args = parser.parse_args()
+
+    meta_ancien, ancien = charger(args.ancien)
+    meta_nouveau, nouveau = charger(args.nouveau)
+    print(f"{meta_ancien['commit']} -> {meta_nouveau['commit']}")
+
+    regressions = []
+    for cle in sorted(set(ancien) & set(nouveau)):
+        ligne = []
+        for metrique, plus_grand_meilleur in METRIQUES.items():
+            avant, apres = ancien[cle].get(metrique), nouveau[cle].get(metrique)
+            if not avant or apres is None:
+                continue
+            rapport = apres / avant
+            ligne.append(f"{metrique}={rapport:.2f}x")
+            degradation = (1 - rapport) if plus_grand_meilleur else (rapport - 1)
+            if degradation > args.seuil:
+                regressions.append((cle, metrique, avant, apres))
+        print(" ".join(str(c) for c in cle), " ".join(ligne))
+
+    for cle, metrique, avant, apres in regressions:
+        print(f"REGRESSION {cle} {metrique}: {avant} -> {apres}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
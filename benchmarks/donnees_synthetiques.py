@@ -0,0 +1,73 @@
+"""
+Fichiers CSV synthétiques tirés des distributions de billets.csv.
+
+Chaque classe (vrais / faux billets) est modélisée par une loi normale
+multivariée ajustée sur billets.csv (moyennes et covariance des trois
+features), mélangées dans les proportions d'origine. Une part de
+margin_low peut être laissée vide comme dans le fichier de référence.
+
+Usage :
+    python benchmarks/donnees_synthetiques.py --tailles 1000 100000 --dossier /tmp/billets
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+RACINE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RACINE)
+
+from inference import COLONNES_UTILES  # noqa: E402
+
+
+def _lois():
+    billets = pd.read_csv(os.path.join(RACINE, "billets.csv"), sep=";")
+    lois = []
+    for _, groupe in billets.groupby("is_genuine"):
+        valeurs = groupe[COLONNES_UTILES].dropna().to_numpy()
+        lois.append((len(groupe) / len(billets), valeurs.mean(axis=0), np.cov(valeurs, rowvar=False)))
+    return lois
+
+
+def generer_donnees(n, graine=0, taux_manquants=0.0):
+    """DataFrame de n billets (margin_low, margin_up, length), arrondis au centième."""
+    rng = np.random.default_rng(graine)
+    lois = _lois()
+    classes = rng.choice(len(lois), size=n, p=[poids for poids, _, _ in lois])
+
+    valeurs = np.empty((n, len(COLONNES_UTILES)))
+    for i, (_, moyenne, covariance) in enumerate(lois):
+        masque = classes == i
+        valeurs[masque] = rng.multivariate_normal(moyenne, covariance, size=int(masque.sum()))
+
+    df = pd.DataFrame(np.round(valeurs, 2), columns=COLONNES_UTILES)
+    if taux_manquants:
+        df.loc[rng.random(n) < taux_manquants, "margin_low"] = np.nan
+    return df
+
+
+def generer_csv(n, graine=0, taux_manquants=0.0, sep=";"):
+    """Contenu CSV (octets) de n billets synthétiques."""
+    return generer_donnees(n, graine, taux_manquants).to_csv(sep=sep, index=False).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dossier", default=".")
+    parser.add_argument("--taux-manquants", type=float, default=0.025)
+    parser.add_argument("--graine", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.dossier, exist_ok=True)
+    for n in args.tailles:
+        chemin = os.path.join(args.dossier, f"billets_synthetiques_{n}.csv")
+        with open(chemin, "wb") as f:
+            f.write(generer_csv(n, args.graine, args.taux_manquants))
+        print(chemin)
+
+
+if __name__ == "__main__":
+    main()
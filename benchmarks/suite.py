@@ -0,0 +1,322 @@
+"""
+Suite de benchmarks de /prediction/ et /monitoring/.
+
+Pour chaque service, taille de fichier et niveau de concurrence, envoie
+--requetes uploads de billets synthétiques et mesure le débit, les
+latences p50/p95/p99, le pic de mémoire (RSS) pendant le scénario et le
+temps de démarrage (chargement du modèle compris).
+
+Deux modes :
+- inprocess : les applications FastAPI sont appelées via TestClient dans
+  ce processus (démarrage = import du module jusqu'à GET /ready = 200)
+- uvicorn : chaque service est lancé dans un processus uvicorn local et
+  appelé en HTTP (démarrage = lancement jusqu'à GET /ready = 200)
+
+Le modèle étant chargé en arrière-plan après le démarrage, /ready est la
+seule mesure qui inclut son chargement.
+
+Le cache de réponses est désactivé par défaut (CACHE_MEMOIRE_OCTETS=0),
+sinon les uploads répétés ne mesureraient que le cache.
+
+Les résultats sont écrits en JSON (un fichier par commit) et se comparent
+avec benchmarks/comparer.py.
+
+Usage :
+    python benchmarks/suite.py --mode uvicorn --tailles 1000 100000 --concurrences 1 8
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from donnees_synthetiques import RACINE, generer_csv
+
+# Service -> (module, route, nom du champ fichier)
+SERVICES = {
+    "prediction": ("api", "/prediction/", "fichier"),
+    "monitoring": ("monitoring", "/monitoring/", "file")
+}
+
+
+def percentile(valeurs, q):
+    valeurs = sorted(valeurs)
+    indice = min(int(round(q / 100 * (len(valeurs) - 1))), len(valeurs) - 1)
+    return valeurs[indice]
+
+
+def statistiques(latences, duree, lignes, erreurs):
+    return {
+        "requetes": len(latences),
+        "erreurs": erreurs,
+        "debit_req_s": round(len(latences) / duree, 3),
+        "debit_lignes_s": round(len(latences) * lignes / duree, 1),
+        "p50_ms": round(percentile(latences, 50) * 1000, 2),
+        "p95_ms": round(percentile(latences, 95) * 1000, 2),
+        "p99_ms": round(percentile(latences, 99) * 1000, 2)
+    }
+
+
+def rss_processus(pid):
+    """Mémoire résidente actuelle d'un processus (Linux, /proc), en Mo."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for ligne in f:
+                if ligne.startswith("VmRSS:"):
+                    return round(int(ligne.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class EchantillonneurRSS:
+    """
+    Pic de RSS d'un processus pendant un seul scénario.
+
+    VmHWM et ru_maxrss sont des maximums sur toute la vie du processus : après
+    le plus gros scénario, tous les suivants afficheraient son pic. Un thread
+    relève donc VmRSS toutes les intervalle_s secondes entre __enter__ et
+    __exit__.
+    """
+
+    def __init__(self, pid, intervalle_s=0.01):
+        self.pid = pid
+        self.intervalle_s = intervalle_s
+        self.arret = threading.Event()
+        self.avant = None
+        self.pic = None
+
+    def _relever(self):
+        rss = rss_processus(self.pid)
+        if rss is not None and (self.pic is None or rss > self.pic):
+            self.pic = rss
+
+    def _boucle(self):
+        while not self.arret.wait(self.intervalle_s):
+            self._relever()
+
+    def __enter__(self):
+        self.avant = rss_processus(self.pid)
+        self.pic = self.avant
+        self.thread = threading.Thread(target=self._boucle, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.arret.set()
+        self.thread.join()
+        self._relever()
+
+
+def multipart(champ, contenu):
+    limite = uuid.uuid4().hex
+    entete = (
+        f"--{limite}\r\n"
+        f'Content-Disposition: form-data; name="{champ}"; filename="billets.csv"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode()
+    return entete + contenu + f"\r\n--{limite}--\r\n".encode(), f"multipart/form-data; boundary={limite}"
+
+
+def lancer_requetes(envoyer, contenu, requetes, concurrence):
+    # Une requête d'échauffement, hors mesure
+    envoyer(contenu)
+
+    def chronometrer(_):
+        debut = time.perf_counter()
+        ok = envoyer(contenu)
+        return time.perf_counter() - debut, ok
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrence) as pool:
+        resultats = list(pool.map(chronometrer, range(requetes)))
+    duree = time.perf_counter() - debut
+
+    latences = [latence for latence, _ in resultats]
+    erreurs = sum(1 for _, ok in resultats if not ok)
+    return latences, duree, erreurs
+
+
+def reponse_valide(statut, corps):
+    if statut != 200:
+        return False
+    try:
+        return "error" not in json.loads(corps)
+    except ValueError:
+        return False
+
+
+# Mode inprocess
+
+def scenario_inprocess(service, tailles, concurrences, requetes):
+    from fastapi.testclient import TestClient
+
+    module, route, champ = SERVICES[service]
+    debut = time.perf_counter()
+    application = importlib.import_module(module).app
+    resultats = []
+
+    with TestClient(application) as client:
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.01)
+        demarrage = time.perf_counter() - debut
+
+        def envoyer(contenu):
+            reponse = client.post(route, files={champ: ("billets.csv", contenu, "text/csv")})
+            return reponse_valide(reponse.status_code, reponse.content)
+
+        for taille in tailles:
+            contenu = generer_csv(taille, graine=taille, taux_manquants=0.025)
+            for concurrence in concurrences:
+                with EchantillonneurRSS(os.getpid()) as rss:
+                    latences, duree, erreurs = lancer_requetes(envoyer, contenu, requetes, concurrence)
+                resultats.append({
+                    "mode": "inprocess",
+                    "service": service,
+                    "route": route,
+                    "lignes": taille,
+                    "octets": len(contenu),
+                    "concurrence": concurrence,
+                    "demarrage_s": round(demarrage, 3),
+                    "rss_avant_mo": rss.avant,
+                    "rss_max_mo": rss.pic,
+                    **statistiques(latences, duree, taille, erreurs)
+                })
+                print(json.dumps(resultats[-1]), file=sys.stderr)
+    return resultats
+
+
+# Mode uvicorn
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def attendre_service(url, processus, delai_max=120):
+    debut = time.perf_counter()
+    while time.perf_counter() - debut < delai_max:
+        if processus.poll() is not None:
+            raise RuntimeError(f"uvicorn s'est arrêté (code {processus.returncode})")
+        try:
+            # 503 (HTTPError) tant que le modèle n'est pas chargé
+            with urllib.request.urlopen(url + "/ready", timeout=1):
+                return time.perf_counter() - debut
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.05)
+    raise RuntimeError("uvicorn n'a pas démarré à temps")
+
+
+def scenario_uvicorn(service, tailles, concurrences, requetes):
+    module, route, champ = SERVICES[service]
+    port = port_libre()
+    url = f"http://127.0.0.1:{port}"
+
+    processus = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=RACINE
+    )
+    resultats = []
+    try:
+        demarrage = attendre_service(url, processus)
+
+        def envoyer(contenu):
+            corps, type_contenu = multipart(champ, contenu)
+            requete = urllib.request.Request(
+                url + route, data=corps, headers={"Content-Type": type_contenu}, method="POST"
+            )
+            try:
+                with urllib.request.urlopen(requete) as reponse:
+                    return reponse_valide(reponse.status, reponse.read())
+            except urllib.error.HTTPError:
+                return False
+
+        for taille in tailles:
+            contenu = generer_csv(taille, graine=taille, taux_manquants=0.025)
+            for concurrence in concurrences:
+                with EchantillonneurRSS(processus.pid) as rss:
+                    latences, duree, erreurs = lancer_requetes(envoyer, contenu, requetes, concurrence)
+                resultats.append({
+                    "mode": "uvicorn",
+                    "service": service,
+                    "route": route,
+                    "lignes": taille,
+                    "octets": len(contenu),
+                    "concurrence": concurrence,
+                    "demarrage_s": round(demarrage, 3),
+                    "rss_avant_mo": rss.avant,
+                    "rss_max_mo": rss.pic,
+                    **statistiques(latences, duree, taille, erreurs)
+                })
+                print(json.dumps(resultats[-1]), file=sys.stderr)
+    finally:
+        processus.terminate()
+        processus.wait(timeout=30)
+    return resultats
+
+
+def commit_courant():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--services", nargs="+", choices=list(SERVICES), default=list(SERVICES))
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--concurrences", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--requetes", type=int, default=20)
+    parser.add_argument("--avec-cache", action="store_true", help="laisse le cache de réponses actif")
+    parser.add_argument("--sortie", default=None, help="fichier JSON (défaut : benchmarks/resultats/<commit>.json)")
+    args = parser.parse_args()
+
+    if not args.avec_cache:
+        os.environ["CACHE_MEMOIRE_OCTETS"] = "0"
+        os.environ["CACHE_DISQUE_DOSSIER"] = ""
+
+    # Les services lisent billets.csv et le modèle relativement au dossier courant
+    os.chdir(RACINE)
+    sys.path.insert(0, RACINE)
+
+    scenario = scenario_inprocess if args.mode == "inprocess" else scenario_uvicorn
+    resultats = []
+    for service in args.services:
+        resultats += scenario(service, args.tailles, args.concurrences, args.requetes)
+
+    commit = commit_courant()
+    rapport = {
+        "meta": {
+            "commit": commit,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu": os.cpu_count(),
+            "avec_cache": args.avec_cache
+        },
+        "resultats": resultats
+    }
+
+    sortie = args.sortie or os.path.join(RACINE, "benchmarks", "resultats", f"{commit}.json")
+    os.makedirs(os.path.dirname(sortie), exist_ok=True)
+    with open(sortie, "w") as f:
+        json.dump(rapport, f, indent=2)
+    print(sortie)
+
+
+if __name__ == "__main__":
+    main()
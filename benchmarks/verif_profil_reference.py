@@ -0,0 +1,87 @@
+"""
+Vérifie le profil de référence (reference_profile.py) contre les tests de
+dérive d'Evidently et compare la latence des deux chemins de /monitoring/.
+
+Les valeurs attendues sont recalculées avec les fonctions SciPy qu'appelle
+ValueDrift (wasserstein_distance normalisée par l'écart-type de la
+référence, ks_2samp) sur les données brutes de billets.csv.
+
+Usage :
+    python benchmarks/verif_profil_reference.py --tailles 10 1000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp, wasserstein_distance
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from donnees_synthetiques import RACINE, generer_donnees  # noqa: E402
+from inference import COLONNES_UTILES  # noqa: E402
+from reference_profile import ProfilReference, TAILLE_MIN_WASSERSTEIN  # noqa: E402
+
+TOLERANCE = 1e-9
+
+
+def attendu(reference, courant):
+    reference = reference.dropna().to_numpy()
+    courant = courant.dropna().to_numpy()
+    if len(reference) > TAILLE_MIN_WASSERSTEIN:
+        return wasserstein_distance(reference, courant) / max(np.std(reference), 0.001)
+    return ks_2samp(reference, courant)[1]
+
+
+def temps_evidently(reference, courant):
+    from evidently import Report
+    from evidently.metrics import ValueDrift
+
+    debut = time.perf_counter()
+    report = Report(metrics=[ValueDrift(column_name=col) for col in COLONNES_UTILES])
+    report.run(reference_data=reference, current_data=courant)
+    return time.perf_counter() - debut
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tailles", type=int, nargs="+", default=[10, 1_000, 100_000])
+    args = parser.parse_args()
+
+    billets = pd.read_csv(os.path.join(RACINE, "billets.csv"), sep=";")
+    reference = billets[COLONNES_UTILES]
+    profil = ProfilReference.construire(reference)
+
+    for n in args.tailles:
+        courant = generer_donnees(n, graine=n)
+        # Décalage progressif pour couvrir les cas avec et sans dérive
+        courant["length"] += 0.5 * (n % 3)
+
+        debut = time.perf_counter()
+        resultat = profil.rapport(courant)
+        duree_profil = time.perf_counter() - debut
+
+        ecarts = {
+            m["column"]: abs(m["value"] - attendu(reference[m["column"]], courant[m["column"]]))
+            for m in resultat["metrics"] if m["metric"] == "ValueDrift"
+        }
+        try:
+            duree_evidently = temps_evidently(reference, courant)
+        except Exception as e:
+            duree_evidently = None
+            print(f"Evidently indisponible : {e}", file=sys.stderr)
+
+        print(json.dumps({
+            "lignes": n,
+            "ecart_max": max(ecarts.values()),
+            "conforme": all(ecart <= TOLERANCE for ecart in ecarts.values()),
+            "profil_ms": round(duree_profil * 1000, 2),
+            "evidently_ms": None if duree_evidently is None else round(duree_evidently * 1000, 2)
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Cache des réponses pour les fichiers renvoyés à l'identique.
+
+La clé combine l'empreinte SHA-256 des octets envoyés, celle de l'artefact
+du modèle et les paramètres de la requête. La valeur est le corps JSON déjà
+sérialisé : un succès ne refait ni l'analyse, ni le scoring, ni la
+sérialisation.
+
+- niveau mémoire : LRU borné en octets
+- niveau disque (optionnel) : un fichier par clé, les plus anciens supprimés
+  au-delà de la taille maximale
+
+Quand le fichier du modèle change (taille ou date de modification), son
+empreinte est recalculée et le cache mémoire est vidé ; les entrées disque
+de l'ancien modèle ne sont plus jamais adressées et finissent évincées.
+"""
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+TAILLE_MEMOIRE = int(os.environ.get("CACHE_MEMOIRE_OCTETS", str(256 * 1024 * 1024)))
+DOSSIER_DISQUE = os.environ.get("CACHE_DISQUE_DOSSIER", "")
+TAILLE_DISQUE = int(os.environ.get("CACHE_DISQUE_OCTETS", str(2 * 1024 ** 3)))
+
+
+def empreinte_octets(contenu):
+    return hashlib.sha256(contenu).hexdigest()
+
+
+class CacheResultats:
+
+    def __init__(self, chemin_modele, taille_memoire=TAILLE_MEMOIRE,
+                 dossier_disque=DOSSIER_DISQUE, taille_disque=TAILLE_DISQUE):
+        self.chemin_modele = chemin_modele
+        self.taille_memoire = taille_memoire
+        self.dossier_disque = dossier_disque or None
+        self.taille_disque = taille_disque
+        self.verrou = threading.Lock()
+
+        self.entrees = OrderedDict()
+        self.octets = 0
+        self.signature_modele = None
+        self.empreinte_modele = None
+        self.compteurs = {
+            "hits_memoire": 0, "hits_disque": 0, "misses": 0,
+            "evictions_memoire": 0, "evictions_disque": 0, "invalidations": 0
+        }
+
+        if self.dossier_disque:
+            os.makedirs(self.dossier_disque, exist_ok=True)
+            self.octets_disque = sum(os.path.getsize(c) for c in self._fichiers_disque())
+        else:
+            self.octets_disque = 0
+
+    def _fichiers_disque(self):
+        return glob.glob(os.path.join(self.dossier_disque, "*.json"))
+
+    def _verifier_modele(self):
+        """Recalcule l'empreinte du modèle si le fichier a changé ; vide alors la mémoire."""
+        stat = os.stat(self.chemin_modele)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if signature == self.signature_modele:
+            return
+
+        with open(self.chemin_modele, "rb") as f:
+            empreinte = hashlib.sha256(f.read()).hexdigest()
+
+        with self.verrou:
+            if self.empreinte_modele is not None and empreinte != self.empreinte_modele:
+                self.entrees.clear()
+                self.octets = 0
+                self.compteurs["invalidations"] += 1
+            self.signature_modele = signature
+            self.empreinte_modele = empreinte
+
+    def cle(self, contenu, *parametres):
+        self._verifier_modele()
+        sha = hashlib.sha256(contenu)
+        sha.update(self.empreinte_modele.encode())
+        for parametre in parametres:
+            sha.update(b"\0" + str(parametre).encode())
+        return sha.hexdigest()
+
+    def lire(self, cle):
+        with self.verrou:
+            if cle in self.entrees:
+                self.entrees.move_to_end(cle)
+                self.compteurs["hits_memoire"] += 1
+                return self.entrees[cle]
+
+        if self.dossier_disque:
+            chemin = os.path.join(self.dossier_disque, f"{cle}.json")
+            try:
+                with open(chemin, "rb") as f:
+                    corps = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                # Remonté en mémoire ; la date du fichier sert d'ordre LRU sur disque
+                os.utime(chemin)
+                with self.verrou:
+                    self.compteurs["hits_disque"] += 1
+                self._ecrire_memoire(cle, corps)
+                return corps
+
+        with self.verrou:
+            self.compteurs["misses"] += 1
+        return None
+
+    def ecrire(self, cle, corps):
+        self._ecrire_memoire(cle, corps)
+        if self.dossier_disque:
+            self._ecrire_disque(cle, corps)
+
+    def _ecrire_memoire(self, cle, corps):
+        if len(corps) > self.taille_memoire:
+            return
+        with self.verrou:
+            if cle in self.entrees:
+                self.octets -= len(self.entrees.pop(cle))
+            self.entrees[cle] = corps
+            self.octets += len(corps)
+            while self.octets > self.taille_memoire:
+                _, ancien = self.entrees.popitem(last=False)
+                self.octets -= len(ancien)
+                self.compteurs["evictions_memoire"] += 1
+
+    def _ecrire_disque(self, cle, corps):
+        if len(corps) > self.taille_disque:
+            return
+        chemin = os.path.join(self.dossier_disque, f"{cle}.json")
+        temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporaire, "wb") as f:
+            f.write(corps)
+        os.replace(temporaire, chemin)
+
+        with self.verrou:
+            self.octets_disque += len(corps)
+            if self.octets_disque <= self.taille_disque:
+                return
+            fichiers = sorted(self._fichiers_disque(), key=os.path.getmtime)
+            self.octets_disque = sum(os.path.getsize(c) for c in fichiers)
+            for ancien in fichiers:
+                if self.octets_disque <= self.taille_disque:
+                    break
+                try:
+                    taille = os.path.getsize(ancien)
+                    os.remove(ancien)
+                except OSError:
+                    continue
+                self.octets_disque -= taille
+                self.compteurs["evictions_disque"] += 1
+
+    def stats(self):
+        with self.verrou:
+            hits = self.compteurs["hits_memoire"] + self.compteurs["hits_disque"]
+            requetes = hits + self.compteurs["misses"]
+            return {
+                **self.compteurs,
+                "taux_hits": hits / requetes if requetes else None,
+                "entrees_memoire": len(self.entrees),
+                "octets_memoire": self.octets,
+                "octets_disque": self.octets_disque,
+                "empreinte_modele": self.empreinte_modele
+            }
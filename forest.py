@@ -0,0 +1,178 @@
+import numpy as np
+
+# Lignes traitées à la fois : borne les tableaux (lignes x arbres) des noeuds courants,
+# environ 40 octets par couple ligne-arbre
+TAILLE_BLOC = 2_048
+
+# Écart maximal toléré avec predict_proba lors de la vérification
+TOLERANCE = 1e-12
+
+
+class NonSupporte(Exception):
+    pass
+
+
+class ForetCompilee:
+    """
+    Forêt aplatie en tableaux NumPy, évaluée d'un seul passage sur tous les arbres.
+
+    Les noeuds de tous les arbres sont concaténés (feature, seuil, enfant
+    gauche, enfant droit, probabilités de feuille). Une feuille pointe sur
+    elle-même. Tous les couples (ligne, arbre) avancent ensemble d'un niveau
+    par itération, et seuls ceux qui ne sont pas encore sur une feuille sont
+    recalculés : le travail suit la longueur réelle des chemins, pas la
+    profondeur maximale.
+
+    Les calculs reproduisent ceux de scikit-learn : standardisation en
+    float64, conversion en float32 avant les arbres, comparaison
+    x <= seuil, normalisation des feuilles puis moyenne dans l'ordre des arbres.
+    """
+
+    def __init__(self, moyenne, echelle, feature, seuil, gauche, droite, valeurs,
+                 racines, profondeur, classes, noms_colonnes=None):
+        self.moyenne = moyenne
+        self.echelle = echelle
+        self.feature = feature
+        self.seuil = seuil
+        self.gauche = gauche
+        self.droite = droite
+        self.valeurs = valeurs
+        self.racines = racines
+        self.profondeur = int(profondeur)
+        self.classes_ = classes
+        self.noms_colonnes = noms_colonnes
+        # Modèle d'origine, utilisé pour les entrées que la forêt aplatie ne gère pas (NaN)
+        self.repli = None
+
+    @classmethod
+    def depuis_pipeline(cls, pipeline):
+        """Convertit Pipeline(StandardScaler, RandomForestClassifier) ; lève NonSupporte sinon."""
+        from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler
+
+        if isinstance(pipeline, Pipeline):
+            etapes = [etape for _, etape in pipeline.steps if etape not in (None, "passthrough")]
+        else:
+            etapes = [pipeline]
+
+        modele = etapes[-1]
+        transformations = etapes[:-1]
+        if not isinstance(modele, (RandomForestClassifier, ExtraTreesClassifier)):
+            raise NonSupporte(f"Estimateur non supporté : {type(modele).__name__}")
+        if modele.n_outputs_ != 1:
+            raise NonSupporte("Forêt multi-sorties non supportée")
+
+        n_features = modele.n_features_in_
+        moyenne = np.zeros(n_features)
+        echelle = np.ones(n_features)
+        if len(transformations) > 1:
+            raise NonSupporte("Pipeline avec plusieurs transformations non supporté")
+        if transformations:
+            scaler = transformations[0]
+            if not isinstance(scaler, StandardScaler):
+                raise NonSupporte(f"Transformation non supportée : {type(scaler).__name__}")
+            if scaler.with_mean:
+                moyenne = scaler.mean_.astype(np.float64)
+            if scaler.with_std:
+                echelle = scaler.scale_.astype(np.float64)
+
+        features, seuils, gauches, droites, valeurs, racines = [], [], [], [], [], []
+        decalage = 0
+        profondeur = 0
+        for arbre in modele.estimators_:
+            t = arbre.tree_
+            n = t.node_count
+            feuille = t.children_left == -1
+            indices = np.arange(n)
+
+            features.append(np.where(feuille, 0, t.feature))
+            seuils.append(np.where(feuille, np.inf, t.threshold))
+            gauches.append(np.where(feuille, indices, t.children_left) + decalage)
+            droites.append(np.where(feuille, indices, t.children_right) + decalage)
+
+            # Même normalisation que DecisionTreeClassifier.predict_proba
+            valeur = t.value[:, 0, :modele.n_classes_].astype(np.float64)
+            normalisation = valeur.sum(axis=1)[:, np.newaxis]
+            normalisation[normalisation == 0.0] = 1.0
+            valeurs.append(valeur / normalisation)
+
+            racines.append(decalage)
+            decalage += n
+            profondeur = max(profondeur, t.max_depth)
+
+        noms_colonnes = getattr(pipeline, "feature_names_in_", None)
+        return cls(
+            moyenne=moyenne,
+            echelle=echelle,
+            feature=np.concatenate(features).astype(np.intp),
+            seuil=np.concatenate(seuils).astype(np.float64),
+            gauche=np.concatenate(gauches).astype(np.intp),
+            droite=np.concatenate(droites).astype(np.intp),
+            valeurs=np.concatenate(valeurs),
+            racines=np.array(racines, dtype=np.intp),
+            profondeur=profondeur,
+            classes=np.asarray(modele.classes_),
+            noms_colonnes=None if noms_colonnes is None else list(noms_colonnes)
+        )
+
+    def _matrice(self, X):
+        if self.noms_colonnes is not None and hasattr(X, "columns"):
+            X = X[self.noms_colonnes]
+        X = np.asarray(X, dtype=np.float64)
+        return ((X - self.moyenne) / self.echelle).astype(np.float32)
+
+    def _proba_bloc(self, Xs):
+        n, n_features = Xs.shape
+        n_arbres = len(self.racines)
+        valeurs_x = np.ascontiguousarray(Xs).ravel()
+
+        # Un élément par couple (ligne, arbre), ligne par ligne
+        noeuds = np.tile(self.racines, n)
+        decalages = np.repeat(np.arange(n) * n_features, n_arbres)
+        actifs = np.arange(n * n_arbres)
+
+        for _ in range(self.profondeur + 1):
+            courants = noeuds[actifs]
+            internes = self.gauche[courants] != courants
+            actifs, courants = actifs[internes], courants[internes]
+            if len(actifs) == 0:
+                break
+            x = valeurs_x[decalages[actifs] + self.feature[courants]]
+            noeuds[actifs] = np.where(x <= self.seuil[courants], self.gauche[courants], self.droite[courants])
+
+        noeuds = noeuds.reshape(n, n_arbres)
+        proba = np.empty((n, self.valeurs.shape[1]))
+        for classe in range(self.valeurs.shape[1]):
+            # cumsum : somme séquentielle dans l'ordre des arbres, comme scikit-learn
+            proba[:, classe] = np.cumsum(self.valeurs[noeuds, classe], axis=1)[:, -1]
+        proba /= n_arbres
+        return proba
+
+    def predict_proba(self, X):
+        Xs = self._matrice(X)
+        if self.repli is not None and np.isnan(Xs).any():
+            return self.repli.predict_proba(X)
+        if len(Xs) <= TAILLE_BLOC:
+            return self._proba_bloc(Xs)
+        return np.concatenate([
+            self._proba_bloc(Xs[debut:debut + TAILLE_BLOC])
+            for debut in range(0, len(Xs), TAILLE_BLOC)
+        ])
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def verifier(foret, pipeline, X):
+    """
+    Compare la forêt compilée à pipeline.predict_proba sur X.
+
+    Retour :
+    - (identique bit à bit, écart absolu maximal)
+    """
+    attendu = pipeline.predict_proba(X)
+    obtenu = foret.predict_proba(X)
+    if attendu.shape != obtenu.shape:
+        return False, float("inf")
+    return bool(np.array_equal(attendu, obtenu)), float(np.max(np.abs(attendu - obtenu), initial=0.0))
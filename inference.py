@@ -0,0 +1,306 @@
+import json
+import os
+import shutil
+import warnings
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Colonnes attendues par le modèle, dans l'ordre d'entraînement
+COLONNES_UTILES = ["margin_low", "margin_up", "length"]
+
+# Les entrées NumPy (sans noms de colonnes) sont déjà dans l'ordre du modèle
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Taille par défaut des morceaux pour la lecture en flux
+TAILLE_MORCEAU = 50_000
+
+CHEMIN_REFERENCE = "billets.csv"
+CHEMIN_IMPUTATION = "imputation_reference.json"
+
+# Colonnes imputées par la médiane de billets.csv, comme dans le notebook
+COLONNES_IMPUTEES = ["margin_low"]
+
+
+class ColonnesManquantes(ValueError):
+    pass
+
+
+def donnees_reference(chemin=CHEMIN_REFERENCE):
+    """Features de billets.csv, margin_low imputée comme dans le notebook."""
+    billets = pd.read_csv(chemin, sep=";")
+    X = billets[COLONNES_UTILES].copy()
+    X["margin_low"] = X["margin_low"].fillna(X["margin_low"].median())
+    return X
+
+
+class ImputationReference:
+    """
+    Imputation fixe des valeurs manquantes par les médianes de billets.csv.
+
+    Les valeurs ne dépendent pas du lot reçu : une ligne seule, un morceau
+    de flux ou un fichier entier donnent la même imputation, donc les mêmes
+    prédictions.
+    """
+
+    def __init__(self, medianes, empreinte):
+        self.medianes = medianes
+        self.empreinte = empreinte
+        # Une valeur par colonne du modèle, NaN pour les colonnes non imputées
+        self.valeurs = np.array([medianes.get(col, np.nan) for col in COLONNES_UTILES], dtype=np.float64)
+
+    @classmethod
+    def construire(cls, reference, empreinte=""):
+        return cls({col: float(reference[col].median()) for col in COLONNES_IMPUTEES}, empreinte)
+
+    def enregistrer(self, chemin=CHEMIN_IMPUTATION):
+        with open(chemin, "w") as f:
+            json.dump({"empreinte": self.empreinte, "medianes": self.medianes}, f, indent=2)
+
+    @classmethod
+    def charger(cls, chemin=CHEMIN_IMPUTATION):
+        with open(chemin) as f:
+            donnees = json.load(f)
+        return cls(donnees["medianes"], donnees["empreinte"])
+
+    def appliquer(self, X):
+        """
+        Remplace les NaN en une seule opération vectorisée.
+
+        X : tableau NumPy n x 3 ou DataFrame contenant COLONNES_UTILES ;
+        le résultat est du même type, le dtype flottant est conservé.
+        """
+        if isinstance(X, pd.DataFrame):
+            return pd.DataFrame(self.appliquer(X[COLONNES_UTILES].to_numpy()), columns=COLONNES_UTILES, index=X.index)
+
+        X = np.asarray(X)
+        if X.dtype.kind != "f":
+            X = X.astype(np.float64)
+        return np.where(np.isnan(X), self.valeurs.astype(X.dtype), X)
+
+
+@lru_cache(maxsize=1)
+def charger_imputation(chemin_reference=CHEMIN_REFERENCE, chemin_imputation=CHEMIN_IMPUTATION):
+    """
+    Charge l'imputation enregistrée, ou la (re)construit si billets.csv a changé.
+    """
+    from reference_profile import empreinte_fichier
+
+    if not os.path.exists(chemin_reference):
+        return ImputationReference.charger(chemin_imputation)
+
+    empreinte = empreinte_fichier(chemin_reference)
+    if os.path.exists(chemin_imputation):
+        imputation = ImputationReference.charger(chemin_imputation)
+        if imputation.empreinte == empreinte:
+            return imputation
+
+    imputation = ImputationReference.construire(pd.read_csv(chemin_reference, sep=";"), empreinte)
+    imputation.enregistrer(chemin_imputation)
+    return imputation
+
+
+def imputer(X):
+    """Imputation de référence (voir ImputationReference.appliquer)."""
+    return charger_imputation().appliquer(X)
+
+
+def scorer(pipeline, X):
+    """
+    Un seul passage predict_proba sur tout le lot.
+
+    Les labels sont déduits de la matrice de probabilités exactement comme
+    le fait RandomForestClassifier.predict (argmax puis classes_).
+
+    Retour :
+    - (labels, proba_0, proba_1) sous forme de tableaux NumPy
+    """
+    proba = pipeline.predict_proba(X)
+    labels = pipeline.classes_.take(np.argmax(proba, axis=1))
+    return labels, proba[:, 0], proba[:, 1]
+
+
+def resultats_lignes(X, labels, proba_0, proba_1):
+    """Réponse par billet pour les entrées JSON (tableau NumPy n x 3)."""
+    colonnes = {col: X[:, i].tolist() for i, col in enumerate(COLONNES_UTILES)}
+    colonnes["predictions"] = labels.tolist()
+    colonnes["probabilités_0"] = np.round(proba_0, 2).tolist()
+    colonnes["probabilités_1"] = np.round(proba_1, 2).tolist()
+    noms = list(colonnes)
+    return [dict(zip(noms, ligne)) for ligne in zip(*colonnes.values())]
+
+
+def resume(labels):
+    """Comptage vrais / faux billets sans passer par pd.Series.value_counts."""
+    total = int(len(labels))
+    faux = int(np.count_nonzero(labels == 1))
+    return {
+        "vrai_billet": total - faux,
+        "faux_billet": faux,
+        "total": total
+    }
+
+
+def colonnes_resultat(df_model, labels, proba_0, proba_1):
+    """
+    Colonnes de la réponse sous forme de listes Python natives.
+
+    L'arrondi est fait en une seule opération vectorisée et tolist() convertit
+    directement en float/int Python, sans objet intermédiaire par ligne.
+    """
+    colonnes = {col: df_model[col].to_numpy().tolist() for col in df_model.columns}
+    colonnes["predictions"] = labels.tolist()
+    colonnes["probabilités_0"] = np.round(proba_0, 2).tolist()
+    colonnes["probabilités_1"] = np.round(proba_1, 2).tolist()
+    return colonnes
+
+
+def construire_reponse(df_model, labels, proba_0, proba_1, format="records"):
+    """
+    Corps JSON de /prediction/.
+
+    - format="records" : liste de dictionnaires (format historique)
+    - format="columns" : un tableau par colonne, bien plus léger à sérialiser
+    """
+    colonnes = colonnes_resultat(df_model, labels, proba_0, proba_1)
+
+    if format == "columns":
+        predictions = colonnes
+    else:
+        noms = list(colonnes)
+        predictions = [dict(zip(noms, ligne)) for ligne in zip(*colonnes.values())]
+
+    return {
+        "predictions": predictions,
+        "summary": resume(labels)
+    }
+
+
+def copier_flux(source, destination, taille_bloc=1024 * 1024):
+    """Copie bloc par bloc un flux binaire (upload) vers un fichier, puis rembobine."""
+    source.seek(0)
+    shutil.copyfileobj(source, destination, taille_bloc)
+    destination.seek(0)
+    return destination
+
+
+def lire_entete(flux):
+    """
+    Lit uniquement la ligne d'en-tête d'un flux binaire puis revient au début.
+
+    Retour :
+    - (séparateur, colonnes manquantes)
+    """
+    position = flux.tell()
+    entete = flux.readline().decode("utf-8-sig")
+    flux.seek(position)
+
+    sep = ";" if ";" in entete else ","
+    colonnes = [col.strip() for col in entete.strip().split(sep)]
+    colonnes_manquantes = [col for col in COLONNES_UTILES if col not in colonnes]
+    return sep, colonnes_manquantes
+
+
+def lire_par_morceaux(flux, sep, taille_morceau=TAILLE_MORCEAU):
+    """
+    Parcourt un CSV par morceaux bornés sans jamais le charger en entier.
+
+    Seules les trois colonnes du modèle sont analysées, en float32.
+    """
+    return pd.read_csv(
+        flux,
+        sep=sep,
+        usecols=COLONNES_UTILES,
+        dtype={col: "float32" for col in COLONNES_UTILES},
+        chunksize=taille_morceau,
+        encoding="utf-8-sig"
+    )
+
+
+def valeurs_float32(valeurs, chiffres=np.finfo(np.float32).precision):
+    """
+    Float32 -> float64 arrondis à `chiffres` chiffres significatifs (6, la
+    précision garantie d'un float32), pour l'affichage.
+
+    Une valeur lue en float32 vaut 4.5199999809 une fois en float64 ;
+    l'arrondi rend la valeur décimale d'origine (4.52), celle que renvoie
+    /prediction/.
+    """
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exposants = np.floor(np.log10(np.abs(valeurs)))
+    exposants = np.where(np.isfinite(exposants), exposants, 0)
+    echelle = 10.0 ** (chiffres - 1 - exposants)
+    return np.round(valeurs * echelle) / echelle
+
+
+def scorer_morceau(scorer_lot, morceau):
+    """
+    Impute et score un morceau lu en float32.
+
+    scorer_lot : fonction X -> (labels, proba_0, proba_1), par exemple
+    functools.partial(scorer, pipeline).
+
+    L'imputation de référence ne dépend pas du découpage : le résultat est
+    le même que sur le fichier entier. Le modèle reçoit les valeurs float32
+    telles quelles (converties en float64) ; seules les valeurs renvoyées
+    sont arrondies (voir valeurs_float32). Une valeur proche d'un seuil des
+    arbres peut donc être classée autrement que par /prediction/, qui lit
+    en float64.
+    """
+    morceau = imputer(morceau)
+    X = morceau[COLONNES_UTILES].astype(np.float64)
+
+    labels, proba_0, proba_1 = scorer_lot(X)
+
+    # Nouveau tableau : X peut encore être lu par le scoring en ombre
+    resultat = pd.DataFrame(valeurs_float32(X.to_numpy()), columns=COLONNES_UTILES, index=X.index)
+    resultat["predictions"] = labels
+    resultat["probabilités_0"] = np.round(proba_0, 2)
+    resultat["probabilités_1"] = np.round(proba_1, 2)
+    return resultat
+
+
+def flux_predictions(scorer_lot, flux, sep, format="ndjson", taille_morceau=TAILLE_MORCEAU):
+    """
+    Générateur de la réponse en flux : NDJSON ou CSV, morceau par morceau.
+
+    Chaque morceau est scoré par scorer_lot (voir scorer_morceau).
+
+    Le résumé cumulé est émis en dernier : une ligne {"summary": ...} en
+    NDJSON, une ligne de commentaire "# summary: ..." en CSV.
+    """
+    vrai, faux = 0, 0
+    premier = True
+
+    try:
+        for morceau in lire_par_morceaux(flux, sep, taille_morceau):
+            resultat = scorer_morceau(scorer_lot, morceau)
+
+            compte = resume(resultat["predictions"].to_numpy())
+            vrai += compte["vrai_billet"]
+            faux += compte["faux_billet"]
+
+            if format == "csv":
+                yield resultat.to_csv(sep=";", index=False, header=premier)
+            else:
+                lignes = resultat.to_json(orient="records", lines=True, force_ascii=False)
+                yield lignes.rstrip("\n") + "\n"
+            premier = False
+
+    except Exception as e:
+        erreur = json.dumps({"error": str(e)}, ensure_ascii=False)
+        yield f"# error: {erreur}\n" if format == "csv" else erreur + "\n"
+        return
+
+    summary = json.dumps(
+        {"summary": {"vrai_billet": vrai, "faux_billet": faux, "total": vrai + faux}}
+    )
+    if format == "csv":
+        # En-tête seul si le fichier ne contenait aucune ligne
+        if premier:
+            yield ";".join(COLONNES_UTILES + ["predictions", "probabilités_0", "probabilités_1"]) + "\n"
+        yield f"# summary: {summary}\n"
+    else:
+        yield summary + "\n"
@@ -0,0 +1,387 @@
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from inference import (
+    TAILLE_MORCEAU, lire_entete, lire_par_morceaux, scorer, scorer_morceau, resume
+)
+from model_loader import ChargeurModele
+from reference_profile import empreinte_fichier
+
+# Configuration (variables d'environnement)
+DOSSIER_JOBS = os.environ.get("JOBS_DOSSIER", "jobs")
+MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "2"))
+# Nombre maximal de jobs en attente ou en cours avant de refuser (backpressure)
+MAX_FILE = int(os.environ.get("JOBS_MAX_FILE", "16"))
+TAILLE_MAX_UPLOAD = int(os.environ.get("JOBS_TAILLE_MAX_UPLOAD", str(5 * 1024 ** 3)))
+# Durée de conservation des jobs terminés (fichiers et état)
+RETENTION_S = int(os.environ.get("JOBS_RETENTION_S", str(24 * 3600)))
+# Battement de cœur de chaque worker uvicorn ; ses jobs sont repris par un
+# autre worker s'il n'a pas battu depuis 3 intervalles
+BATTEMENT_S = float(os.environ.get("JOBS_BATTEMENT_S", "10"))
+
+# Processus du pool créés sans fork : le processus parent a déjà des threads
+# (threadpool, scoring en ombre), dont les verrous seraient copiés tels quels
+CONTEXTE = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ERREUR = "erreur"
+
+
+class FileJobsPleine(Exception):
+    pass
+
+
+def _connexion(chemin_base):
+    connexion = sqlite3.connect(chemin_base, timeout=30)
+    connexion.row_factory = sqlite3.Row
+    return connexion
+
+
+def _mettre_a_jour(chemin_base, job_id, proprietaire=None, **champs):
+    """
+    Met à jour un job ; avec proprietaire, seulement s'il en est toujours le
+    propriétaire. Renvoie True si la ligne a été modifiée.
+    """
+    champs["mis_a_jour"] = time.time()
+    affectations = ", ".join(f"{nom} = ?" for nom in champs)
+    requete = f"UPDATE jobs SET {affectations} WHERE id = ?"
+    parametres = [*champs.values(), job_id]
+    if proprietaire is not None:
+        requete += " AND proprietaire = ?"
+        parametres.append(proprietaire)
+    with _connexion(chemin_base) as connexion:
+        return connexion.execute(requete, parametres).rowcount == 1
+
+
+# Modèle chargé une seule fois par processus du pool (bundle mmap partagé),
+# rechargé si le pickle a été remplacé depuis (POST /models/reload)
+_chargeur_processus = None
+_empreinte_processus = None
+
+
+def _moteur(chemin_modele):
+    global _chargeur_processus, _empreinte_processus
+    empreinte = empreinte_fichier(chemin_modele)
+    if _chargeur_processus is None or empreinte != _empreinte_processus:
+        _chargeur_processus = ChargeurModele(chemin_modele)
+        _empreinte_processus = empreinte
+    return _chargeur_processus.moteur
+
+
+def executer_job(chemin_base, job_id, chemin_entree, chemin_sortie, chemin_modele, proprietaire,
+                 taille_morceau=TAILLE_MORCEAU):
+    """
+    Score un fichier déposé, morceau par morceau, dans un processus du pool.
+
+    La progression (lignes traitées, part du fichier lue) est écrite dans la
+    base après chaque morceau ; le résultat est un CSV ";" sur disque. Toutes
+    les écritures sont conditionnées au propriétaire : un job repris par un
+    autre worker n'est ni écrasé ni supprimé par celui-ci.
+    """
+    if not _mettre_a_jour(chemin_base, job_id, proprietaire, statut=EN_COURS):
+        return
+
+    temporaire = f"{chemin_sortie}.{os.getpid()}.tmp"
+    termine = False
+    try:
+        moteur = _moteur(chemin_modele)
+        taille = max(os.path.getsize(chemin_entree), 1)
+
+        with open(chemin_entree, "rb") as entree, open(temporaire, "w", encoding="utf-8") as sortie:
+            sep, colonnes_manquantes = lire_entete(entree)
+            if colonnes_manquantes:
+                raise ValueError(f"Colonnes manquantes : {', '.join(colonnes_manquantes)}")
+
+            vrai, faux = 0, 0
+            premier = True
+            for morceau in lire_par_morceaux(entree, sep, taille_morceau):
+                resultat = scorer_morceau(partial(scorer, moteur), morceau)
+                resultat.to_csv(sortie, sep=";", index=False, header=premier)
+                premier = False
+
+                compte = resume(resultat["predictions"].to_numpy())
+                vrai += compte["vrai_billet"]
+                faux += compte["faux_billet"]
+                if not _mettre_a_jour(
+                    chemin_base, job_id, proprietaire,
+                    lignes=vrai + faux,
+                    progression=min(entree.tell() / taille, 1.0)
+                ):
+                    return
+
+        os.replace(temporaire, chemin_sortie)
+        summary = {"vrai_billet": vrai, "faux_billet": faux, "total": vrai + faux}
+        termine = _mettre_a_jour(
+            chemin_base, job_id, proprietaire, statut=TERMINE, progression=1.0, summary=json.dumps(summary)
+        )
+
+    except Exception as e:
+        termine = _mettre_a_jour(chemin_base, job_id, proprietaire, statut=ERREUR, erreur=str(e))
+
+    finally:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+        # Le fichier déposé n'est plus utile une fois le job fini par son propriétaire
+        if termine and os.path.exists(chemin_entree):
+            os.remove(chemin_entree)
+
+
+class GestionnaireJobs:
+    """
+    Jobs de scoring asynchrones : état dans SQLite, fichiers sur disque,
+    calcul dans un ProcessPoolExecutor hors de la boucle d'événements.
+
+    Chaque worker uvicorn a son identifiant de propriétaire et bat dans la
+    table proprietaires. Un job n'est lancé qu'après l'avoir réclamé par un
+    UPDATE conditionnel : avec --workers N, un job interrompu n'est repris
+    qu'une fois, et jamais tant que son propriétaire est vivant.
+    """
+
+    def __init__(self, chemin_modele, dossier=DOSSIER_JOBS, max_workers=MAX_WORKERS,
+                 max_file=MAX_FILE, retention_s=RETENTION_S):
+        self.chemin_modele = chemin_modele
+        self.dossier = dossier
+        self.chemin_base = os.path.join(dossier, "jobs.sqlite")
+        self.max_workers = max_workers
+        self.max_file = max_file
+        self.retention_s = retention_s
+        self.executeur = None
+        self.proprietaire = uuid.uuid4().hex
+        self.arret = threading.Event()
+        self.thread_battement = None
+        self.verrou_executeur = threading.Lock()
+
+    def demarrer(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        with _connexion(self.chemin_base) as connexion:
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    statut TEXT NOT NULL,
+                    cree TEXT,
+                    cree_ts REAL NOT NULL,
+                    mis_a_jour REAL NOT NULL,
+                    lignes INTEGER DEFAULT 0,
+                    progression REAL DEFAULT 0,
+                    summary TEXT,
+                    erreur TEXT
+                )
+                """
+            )
+            connexion.execute(
+                "CREATE TABLE IF NOT EXISTS proprietaires (id TEXT PRIMARY KEY, vu_ts REAL NOT NULL)"
+            )
+            try:
+                # Base créée avant l'ajout des propriétaires
+                connexion.execute("ALTER TABLE jobs ADD COLUMN proprietaire TEXT")
+            except sqlite3.OperationalError:
+                pass
+        self.executeur = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=CONTEXTE)
+
+        self._battre()
+        self.reprendre_orphelins()
+        self.arret.clear()
+        self.thread_battement = threading.Thread(target=self._boucle_battement, name="jobs", daemon=True)
+        self.thread_battement.start()
+
+    def arreter(self):
+        self.arret.set()
+        if self.thread_battement is not None:
+            self.thread_battement.join(timeout=1)
+            self.thread_battement = None
+        with self.verrou_executeur:
+            if self.executeur is not None:
+                self.executeur.shutdown(wait=False, cancel_futures=True)
+                self.executeur = None
+        # Les jobs encore à nous deviennent orphelins tout de suite
+        with _connexion(self.chemin_base) as connexion:
+            connexion.execute("DELETE FROM proprietaires WHERE id = ?", (self.proprietaire,))
+
+    def _battre(self):
+        with _connexion(self.chemin_base) as connexion:
+            connexion.execute(
+                "INSERT OR REPLACE INTO proprietaires (id, vu_ts) VALUES (?, ?)", (self.proprietaire, time.time())
+            )
+
+    def _boucle_battement(self):
+        while not self.arret.wait(BATTEMENT_S):
+            try:
+                self._battre()
+                self.reprendre_orphelins()
+            except sqlite3.Error:
+                # Base momentanément verrouillée : nouvel essai au prochain battement
+                pass
+
+    def reprendre_orphelins(self):
+        """
+        Réclame et relance les jobs actifs dont le propriétaire ne bat plus
+        (worker arrêté ou mort) ; chaque job n'est réclamé que par un worker.
+        """
+        limite = time.time() - 3 * BATTEMENT_S
+        with _connexion(self.chemin_base) as connexion:
+            orphelins = connexion.execute(
+                """
+                SELECT jobs.id, jobs.statut, jobs.proprietaire FROM jobs
+                LEFT JOIN proprietaires ON proprietaires.id = jobs.proprietaire
+                WHERE jobs.statut IN (?, ?) AND (proprietaires.vu_ts IS NULL OR proprietaires.vu_ts < ?)
+                """,
+                (EN_ATTENTE, EN_COURS, limite)
+            ).fetchall()
+            connexion.execute("DELETE FROM proprietaires WHERE vu_ts < ?", (limite,))
+
+        for ligne in orphelins:
+            with _connexion(self.chemin_base) as connexion:
+                reclame = connexion.execute(
+                    """
+                    UPDATE jobs SET statut = ?, proprietaire = ?, lignes = 0, progression = 0, mis_a_jour = ?
+                    WHERE id = ? AND statut = ? AND proprietaire IS ?
+                    """,
+                    (EN_ATTENTE, self.proprietaire, time.time(), ligne["id"], ligne["statut"], ligne["proprietaire"])
+                ).rowcount == 1
+            if not reclame:
+                continue
+            if os.path.exists(self.chemin_entree(ligne["id"])):
+                self._lancer(ligne["id"])
+            else:
+                _mettre_a_jour(
+                    self.chemin_base, ligne["id"], self.proprietaire, statut=ERREUR, erreur="Job interrompu"
+                )
+
+    def chemin_entree(self, job_id):
+        return os.path.join(self.dossier, job_id, "entree.csv")
+
+    def chemin_resultat(self, job_id):
+        return os.path.join(self.dossier, job_id, "resultat.csv")
+
+    def actifs(self):
+        with _connexion(self.chemin_base) as connexion:
+            return connexion.execute(
+                "SELECT COUNT(*) FROM jobs WHERE statut IN (?, ?)", (EN_ATTENTE, EN_COURS)
+            ).fetchone()[0]
+
+    def verifier_capacite(self):
+        if self.actifs() >= self.max_file:
+            raise FileJobsPleine(f"File de jobs pleine ({self.max_file} jobs actifs)")
+
+    def nouveau_job(self):
+        """Réserve un identifiant et son dossier ; l'upload y est ensuite copié."""
+        self.verifier_capacite()
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.dossier, job_id))
+        return job_id
+
+    def soumettre(self, job_id):
+        self.purger()
+        # Revérifié ici : d'autres jobs ont pu arriver pendant la copie
+        self.verifier_capacite()
+        maintenant = time.time()
+        with _connexion(self.chemin_base) as connexion:
+            connexion.execute(
+                """
+                INSERT INTO jobs (id, statut, cree, cree_ts, mis_a_jour, proprietaire)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, EN_ATTENTE, time.strftime("%Y-%m-%dT%H:%M:%S"), maintenant, maintenant, self.proprietaire)
+            )
+        self._lancer(job_id)
+        return job_id
+
+    def abandonner(self, job_id):
+        """Supprime le job : dossier et ligne, pour qu'il ne compte plus dans la file."""
+        with _connexion(self.chemin_base) as connexion:
+            connexion.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(os.path.join(self.dossier, job_id), ignore_errors=True)
+
+    def _recreer_executeur(self, ancien):
+        """Remplace un pool cassé (processus tué, par exemple par l'OOM killer)."""
+        with self.verrou_executeur:
+            if self.executeur is ancien and ancien is not None:
+                ancien.shutdown(wait=False, cancel_futures=True)
+                self.executeur = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=CONTEXTE)
+            return self.executeur
+
+    def _lancer(self, job_id):
+        # chemin_modele peut être une fonction (modèle principal du registre au moment du lancement)
+        chemin_modele = self.chemin_modele() if callable(self.chemin_modele) else self.chemin_modele
+        arguments = (
+            executer_job, self.chemin_base, job_id,
+            self.chemin_entree(job_id), self.chemin_resultat(job_id), chemin_modele, self.proprietaire
+        )
+        executeur = self.executeur
+        try:
+            futur = executeur.submit(*arguments)
+        except BrokenProcessPool:
+            executeur = self._recreer_executeur(executeur)
+            futur = executeur.submit(*arguments)
+        futur.add_done_callback(partial(self._job_fini, job_id, executeur))
+
+    def _job_fini(self, job_id, executeur, futur):
+        """
+        executer_job gère ses propres erreurs : une exception ici veut dire que
+        le processus de calcul est mort. Le pool est alors recréé ; un job qui
+        n'avait pas commencé est relancé, celui qui tournait passe en erreur.
+        """
+        if futur.cancelled() or futur.exception() is None:
+            return
+        erreur = futur.exception()
+
+        if isinstance(erreur, BrokenProcessPool):
+            self._recreer_executeur(executeur)
+            statut = self.statut(job_id)
+            if statut is not None and statut["statut"] == EN_ATTENTE and self.executeur is not None:
+                self._lancer(job_id)
+                return
+
+        _mettre_a_jour(
+            self.chemin_base, job_id, self.proprietaire,
+            statut=ERREUR, erreur=f"Processus de calcul interrompu : {type(erreur).__name__}"
+        )
+        if os.path.exists(self.chemin_entree(job_id)):
+            os.remove(self.chemin_entree(job_id))
+
+    def statut(self, job_id):
+        with _connexion(self.chemin_base) as connexion:
+            ligne = connexion.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if ligne is None:
+            return None
+
+        job = {
+            "job_id": ligne["id"],
+            "statut": ligne["statut"],
+            "cree": ligne["cree"],
+            "lignes": ligne["lignes"],
+            "progression": round(ligne["progression"], 4)
+        }
+        if ligne["statut"] == TERMINE:
+            job["summary"] = json.loads(ligne["summary"])
+            job["resultat"] = f"/jobs/{job_id}/resultat"
+        if ligne["statut"] == ERREUR:
+            job["error"] = ligne["erreur"]
+        return job
+
+    def purger(self):
+        """Supprime les jobs terminés (ou en erreur) plus vieux que la rétention."""
+        limite = time.time() - self.retention_s
+        with _connexion(self.chemin_base) as connexion:
+            anciens = connexion.execute(
+                "SELECT id FROM jobs WHERE statut IN (?, ?) AND mis_a_jour < ?",
+                (TERMINE, ERREUR, limite)
+            ).fetchall()
+            connexion.executemany("DELETE FROM jobs WHERE id = ?", [(l["id"],) for l in anciens])
+        for ligne in anciens:
+            self.abandonner(ligne["id"])
@@ -0,0 +1,284 @@
+"""
+Suivi de dérive en continu sur le flux des prédictions.
+
+Côté API, JournalPredictions ajoute chaque lot scoré à un journal binaire
+rotatif : un en-tête (horodatage float64, nombre de lignes uint32) suivi des
+lignes en float32 (margin_low, margin_up, length, prediction), soit 16 octets
+par billet. Chaque processus écrit dans ses propres fichiers.
+
+Côté monitoring, MoteurDeriveLive lit uniquement les octets ajoutés depuis
+le dernier appel et met à jour des esquisses additionnables par fenêtre
+fixe (histogrammes sur les bornes du profil de référence, sommes des
+dépassements hors plage, compte de faux billets). La fenêtre glissante est
+la somme des dernières fenêtres fixes, tenue à jour par ajout et retrait :
+rien n'est jamais relu.
+"""
+import glob
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from inference import COLONNES_UTILES
+from reference_profile import SEUIL_WASSERSTEIN
+
+DOSSIER_JOURNAL = os.environ.get("JOURNAL_DOSSIER", "journal_predictions")
+JOURNAL_ACTIF = os.environ.get("JOURNAL_ACTIF", "1") == "1"
+ROTATION_OCTETS = int(os.environ.get("JOURNAL_ROTATION_OCTETS", str(64 * 1024 * 1024)))
+MAX_FICHIERS = int(os.environ.get("JOURNAL_MAX_FICHIERS", "200"))
+
+# Fenêtres fixes de FENETRE_S secondes, fenêtre glissante sur les N_FENETRES dernières
+FENETRE_S = int(os.environ.get("MONITORING_FENETRE_S", "300"))
+N_FENETRES = int(os.environ.get("MONITORING_N_FENETRES", "12"))
+
+ENTETE = struct.Struct("<dI")
+N_CHAMPS = len(COLONNES_UTILES) + 1
+OCTETS_LIGNE = 4 * N_CHAMPS
+
+
+class JournalPredictions:
+
+    def __init__(self, dossier=DOSSIER_JOURNAL, rotation_octets=ROTATION_OCTETS,
+                 max_fichiers=MAX_FICHIERS, actif=JOURNAL_ACTIF):
+        self.dossier = dossier
+        self.rotation_octets = rotation_octets
+        self.max_fichiers = max_fichiers
+        self.actif = actif
+        self.verrou = threading.Lock()
+        self.fichier = None
+
+    def _ouvrir(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        nom = f"predictions-{int(time.time() * 1000):015d}-{os.getpid()}.bin"
+        self.fichier = open(os.path.join(self.dossier, nom), "ab")
+        self._purger()
+
+    def _purger(self):
+        fichiers = sorted(glob.glob(os.path.join(self.dossier, "predictions-*.bin")))
+        for chemin in fichiers[:-self.max_fichiers]:
+            try:
+                os.remove(chemin)
+            except OSError:
+                pass
+
+    def ajouter(self, X, labels):
+        """Ajoute un lot (features n x 3, labels n) en un seul bloc."""
+        if not self.actif or len(labels) == 0:
+            return
+
+        lignes = np.empty((len(labels), N_CHAMPS), dtype="<f4")
+        lignes[:, :-1] = np.asarray(X, dtype=np.float64)
+        lignes[:, -1] = labels
+        bloc = ENTETE.pack(time.time(), len(labels)) + lignes.tobytes()
+
+        with self.verrou:
+            if self.fichier is None or self.fichier.tell() >= self.rotation_octets:
+                if self.fichier is not None:
+                    self.fichier.close()
+                self._ouvrir()
+            # Un seul write par bloc : le lecteur ne voit jamais de bloc entrelacé
+            self.fichier.write(bloc)
+            self.fichier.flush()
+
+    def fermer(self):
+        with self.verrou:
+            if self.fichier is not None:
+                self.fichier.close()
+                self.fichier = None
+
+
+def _indices_bins(bornes, valeurs):
+    # 0 : sous le minimum de référence, len(bornes) : au-delà du maximum
+    return np.searchsorted(bornes, valeurs, side="right")
+
+
+class Esquisse:
+    """Statistiques additionnables d'une fenêtre : histogrammes, dépassements, faux billets."""
+
+    def __init__(self, n_bins):
+        self.histogrammes = np.zeros((len(COLONNES_UTILES), n_bins), dtype=np.int64)
+        self.sous_min = np.zeros(len(COLONNES_UTILES))
+        self.sur_max = np.zeros(len(COLONNES_UTILES))
+        self.lignes = 0
+        self.faux = 0
+
+    def ajouter(self, autre, signe=1):
+        self.histogrammes += signe * autre.histogrammes
+        self.sous_min += signe * autre.sous_min
+        self.sur_max += signe * autre.sur_max
+        self.lignes += signe * autre.lignes
+        self.faux += signe * autre.faux
+
+
+class MoteurDeriveLive:
+
+    def __init__(self, profil, dossier=DOSSIER_JOURNAL, fenetre_s=FENETRE_S, n_fenetres=N_FENETRES):
+        self.dossier = dossier
+        self.fenetre_s = fenetre_s
+        self.n_fenetres = n_fenetres
+        self.verrou = threading.Lock()
+        self.positions = {}
+
+        self.bornes = [profil.colonnes[col]["bornes"] for col in COLONNES_UTILES]
+        self.minimums = np.array([b[0] for b in self.bornes])
+        self.maximums = np.array([b[-1] for b in self.bornes])
+        self.ecarts_types = np.array(
+            [max(float(profil.colonnes[col]["ecart_type"]), 0.001) for col in COLONNES_UTILES]
+        )
+        self.n_bins = len(self.bornes[0]) + 1
+
+        # Histogrammes de référence sur les mêmes bins, en proportions
+        self.reference = np.array([
+            np.bincount(_indices_bins(b, profil.colonnes[col]["tri"]), minlength=self.n_bins)
+            for b, col in zip(self.bornes, COLONNES_UTILES)
+        ], dtype=np.float64)
+        self.reference /= self.reference.sum(axis=1, keepdims=True)
+
+        self.fenetres = {}
+        self.glissante = Esquisse(self.n_bins)
+        self.total = Esquisse(self.n_bins)
+        self.derniere_fenetre = None
+        self.premiere_fenetre = None
+
+    def _esquisse_bloc(self, lignes):
+        esquisse = Esquisse(self.n_bins)
+        for i, bornes in enumerate(self.bornes):
+            valeurs = lignes[:, i].astype(np.float64)
+            valeurs = valeurs[np.isfinite(valeurs)]
+            esquisse.histogrammes[i] = np.bincount(_indices_bins(bornes, valeurs), minlength=self.n_bins)
+            esquisse.sous_min[i] = np.sum(np.clip(self.minimums[i] - valeurs, 0, None))
+            esquisse.sur_max[i] = np.sum(np.clip(valeurs - self.maximums[i], 0, None))
+        esquisse.lignes = len(lignes)
+        esquisse.faux = int(np.count_nonzero(lignes[:, -1] == 1))
+        return esquisse
+
+    def _ingerer(self, horodatage, lignes):
+        fenetre = int(horodatage // self.fenetre_s)
+        if self.premiere_fenetre is None or fenetre < self.premiere_fenetre:
+            self.premiere_fenetre = fenetre
+        if self.derniere_fenetre is not None and fenetre <= self.derniere_fenetre - self.n_fenetres:
+            # Bloc trop ancien pour la fenêtre glissante : seulement le cumul
+            self.total.ajouter(self._esquisse_bloc(lignes))
+            return
+
+        esquisse = self._esquisse_bloc(lignes)
+        self.fenetres.setdefault(fenetre, Esquisse(self.n_bins)).ajouter(esquisse)
+        self.glissante.ajouter(esquisse)
+        self.total.ajouter(esquisse)
+        self._avancer(fenetre)
+
+    def _avancer(self, fenetre):
+        """Fait avancer la fenêtre courante, y compris sans trafic, et retire les fenêtres expirées."""
+        if self.derniere_fenetre is None or fenetre > self.derniere_fenetre:
+            self.derniere_fenetre = fenetre
+            for ancienne in [f for f in self.fenetres if f <= fenetre - self.n_fenetres]:
+                self.glissante.ajouter(self.fenetres.pop(ancienne), signe=-1)
+
+    def _lire(self, chemin):
+        position = self.positions.get(chemin, 0)
+        with open(chemin, "rb") as f:
+            f.seek(position)
+            donnees = f.read()
+
+        curseur = 0
+        while curseur + ENTETE.size <= len(donnees):
+            horodatage, n = ENTETE.unpack_from(donnees, curseur)
+            fin = curseur + ENTETE.size + n * OCTETS_LIGNE
+            if fin > len(donnees):
+                # Bloc en cours d'écriture : repris au prochain appel
+                break
+            lignes = np.frombuffer(donnees, dtype="<f4", count=n * N_CHAMPS, offset=curseur + ENTETE.size)
+            self._ingerer(horodatage, lignes.reshape(n, N_CHAMPS))
+            curseur = fin
+
+        self.positions[chemin] = position + curseur
+
+    def rafraichir(self):
+        """Intègre les blocs ajoutés au journal depuis le dernier appel."""
+        with self.verrou:
+            self._avancer(int(time.time() // self.fenetre_s))
+            fichiers = sorted(glob.glob(os.path.join(self.dossier, "predictions-*.bin")))
+            horizon = time.time() - self.fenetre_s * self.n_fenetres
+
+            for chemin in fichiers:
+                try:
+                    if chemin not in self.positions and os.path.getmtime(chemin) < horizon:
+                        # Fichier antérieur à la fenêtre glissante au démarrage
+                        self.positions[chemin] = os.path.getsize(chemin)
+                        continue
+                    if os.path.getsize(chemin) > self.positions.get(chemin, 0):
+                        self._lire(chemin)
+                except FileNotFoundError:
+                    pass
+
+            # Fichiers supprimés par la rotation
+            existants = set(fichiers)
+            for chemin in [c for c in self.positions if c not in existants]:
+                del self.positions[chemin]
+
+    def _derive(self, esquisse):
+        """
+        Distance de Wasserstein normalisée approchée à partir des histogrammes.
+
+        Dans la plage de référence, les fonctions de répartition sont
+        interpolées linéairement dans chaque bin ; hors plage, la
+        contribution est exacte grâce aux sommes des dépassements.
+        """
+        derive = {}
+        for i, col in enumerate(COLONNES_UTILES):
+            n = esquisse.histogrammes[i].sum()
+            if n == 0:
+                derive[col] = None
+                continue
+
+            courant = esquisse.histogrammes[i] / n
+            cdf_ref = np.cumsum(self.reference[i])[:-1]
+            cdf_cur = np.cumsum(courant)[:-1]
+            ecarts = np.abs(cdf_ref - cdf_cur)
+            largeurs = np.diff(self.bornes[i])
+            interieur = np.sum((ecarts[:-1] + ecarts[1:]) / 2 * largeurs)
+            exterieur = (esquisse.sous_min[i] + esquisse.sur_max[i]) / n
+            wasserstein = float((interieur + exterieur) / self.ecarts_types[i])
+
+            # PSI sur les mêmes bins
+            p = np.clip(self.reference[i], 1e-6, None)
+            q = np.clip(courant, 1e-6, None)
+            psi = float(np.sum((q - p) * np.log(q / p)))
+
+            derive[col] = {
+                "wasserstein_norme": round(wasserstein, 6),
+                "psi": round(psi, 6),
+                "drift_detected": bool(wasserstein >= SEUIL_WASSERSTEIN)
+            }
+        return derive
+
+    def _resume(self, esquisse, premiere, derniere):
+        return {
+            "debut": premiere * self.fenetre_s,
+            "fin": (derniere + 1) * self.fenetre_s,
+            "lignes": int(esquisse.lignes),
+            "faux_billet": int(esquisse.faux),
+            "taux_faux": esquisse.faux / esquisse.lignes if esquisse.lignes else None,
+            "derive": self._derive(esquisse)
+        }
+
+    def etat(self):
+        """
+        Fenêtres alignées sur l'heure actuelle : sans trafic récent, la fenêtre
+        courante est vide (lignes = 0) au lieu de répéter la dernière qui avait
+        des données. debut et fin sont des horodatages Unix.
+        """
+        with self.verrou:
+            self._avancer(int(time.time() // self.fenetre_s))
+            derniere = self.derniere_fenetre
+            courante = self.fenetres.get(derniere, Esquisse(self.n_bins))
+            premiere_totale = derniere if self.premiere_fenetre is None else self.premiere_fenetre
+            return {
+                "fenetre_s": self.fenetre_s,
+                "n_fenetres": self.n_fenetres,
+                "fenetre_courante": self._resume(courante, derniere, derniere),
+                "fenetre_glissante": self._resume(self.glissante, derniere - self.n_fenetres + 1, derniere),
+                "cumul": self._resume(self.total, premiere_totale, derniere)
+            }
@@ -0,0 +1,199 @@
+"""
+Métriques des services au format texte Prometheus (GET /metrics).
+
+Histogrammes et compteurs minimalistes, sans dépendance : une observation
+coûte un perf_counter, une recherche dichotomique et un verrou, ce qui
+permet de les laisser actifs en production. Chaque processus uvicorn
+expose ses propres valeurs.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from profileur import PROFILEUR
+
+BUCKETS_DUREE = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+BUCKETS_PAR_LIGNE = (1e-7, 2.5e-7, 5e-7, 1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 1e-3, 1e-2)
+
+
+def _etiquettes(noms, valeurs, supplement=""):
+    paires = [f'{nom}="{valeur}"' for nom, valeur in zip(noms, valeurs)]
+    if supplement:
+        paires.append(supplement)
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+
+class Compteur:
+
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self.valeurs = {}
+        self.verrou = threading.Lock()
+
+    def incrementer(self, n=1, **etiquettes):
+        cle = tuple(str(etiquettes[nom]) for nom in self.etiquettes)
+        with self.verrou:
+            self.valeurs[cle] = self.valeurs.get(cle, 0) + n
+
+    def exposition(self):
+        lignes = [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} counter"]
+        with self.verrou:
+            for cle, valeur in sorted(self.valeurs.items()):
+                lignes.append(f"{self.nom}{_etiquettes(self.etiquettes, cle)} {valeur}")
+        return lignes
+
+
+class Histogramme:
+
+    def __init__(self, nom, aide, etiquettes=(), buckets=BUCKETS_DUREE):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self.buckets = tuple(buckets)
+        # cle -> [comptes par bucket (non cumulés), somme, nombre]
+        self.series = {}
+        self.verrou = threading.Lock()
+
+    def observer(self, valeur, **etiquettes):
+        cle = tuple(str(etiquettes[nom]) for nom in self.etiquettes)
+        indice = bisect.bisect_left(self.buckets, valeur)
+        with self.verrou:
+            serie = self.series.get(cle)
+            if serie is None:
+                serie = self.series[cle] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valeur
+            serie[2] += 1
+
+    def exposition(self):
+        lignes = [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} histogram"]
+        with self.verrou:
+            for cle, (comptes, somme, nombre) in sorted(self.series.items()):
+                cumul = 0
+                for borne, compte in zip(self.buckets, comptes):
+                    cumul += compte
+                    le = _etiquettes(self.etiquettes, cle, f'le="{borne}"')
+                    lignes.append(f"{self.nom}_bucket{le} {cumul}")
+                le = _etiquettes(self.etiquettes, cle, 'le="+Inf"')
+                lignes.append(f"{self.nom}_bucket{le} {nombre}")
+                lignes.append(f"{self.nom}_sum{_etiquettes(self.etiquettes, cle)} {somme}")
+                lignes.append(f"{self.nom}_count{_etiquettes(self.etiquettes, cle)} {nombre}")
+        return lignes
+
+
+class Registre:
+
+    def __init__(self):
+        self.metriques = []
+
+    def compteur(self, nom, aide, etiquettes=()):
+        metrique = Compteur(nom, aide, etiquettes)
+        self.metriques.append(metrique)
+        return metrique
+
+    def histogramme(self, nom, aide, etiquettes=(), buckets=BUCKETS_DUREE):
+        metrique = Histogramme(nom, aide, etiquettes, buckets)
+        self.metriques.append(metrique)
+        return metrique
+
+    def exposition(self):
+        lignes = []
+        for metrique in self.metriques:
+            lignes += metrique.exposition()
+        return "\n".join(lignes) + "\n"
+
+
+REGISTRE = Registre()
+
+DUREE_ETAPE = REGISTRE.histogramme(
+    "billets_etape_duree_secondes", "Durée de chaque étape du traitement d'une requête",
+    etiquettes=("service", "etape")
+)
+DUREE_REQUETE = REGISTRE.histogramme(
+    "billets_requete_duree_secondes", "Durée totale d'une requête", etiquettes=("service",)
+)
+INFERENCE_PAR_LIGNE = REGISTRE.histogramme(
+    "billets_inference_secondes_par_ligne", "Temps d'inférence du modèle divisé par le nombre de lignes",
+    etiquettes=("service",), buckets=BUCKETS_PAR_LIGNE
+)
+LIGNES = REGISTRE.compteur("billets_lignes_total", "Lignes traitées", etiquettes=("service",))
+OCTETS = REGISTRE.compteur("billets_octets_total", "Octets reçus", etiquettes=("service",))
+ERREURS = REGISTRE.compteur("billets_erreurs_total", "Erreurs par type", etiquettes=("service", "type"))
+
+
+@contextmanager
+def etape(service, nom):
+    """Chronomètre un bloc et l'enregistre dans billets_etape_duree_secondes."""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        DUREE_ETAPE.observer(time.perf_counter() - debut, service=service, etape=nom)
+
+
+def observer_inference(service, duree, lignes):
+    DUREE_ETAPE.observer(duree, service=service, etape="inference")
+    if lignes:
+        INFERENCE_PAR_LIGNE.observer(duree / lignes, service=service)
+        LIGNES.incrementer(lignes, service=service)
+
+
+def reponse_erreur(service, e):
+    """
+    Compte l'erreur par type et renvoie {"error": ...} avec un vrai code HTTP :
+    400 pour les données invalides (ValueError, KeyError), 500 sinon.
+    """
+    ERREURS.incrementer(service=service, type=type(e).__name__)
+    statut = 400 if isinstance(e, (ValueError, KeyError)) else 500
+    return JSONResponse(status_code=statut, content={"error": str(e)})
+
+
+async def erreur_validation(request, exc: RequestValidationError):
+    """
+    422 au format {"error": ...} sans renvoyer les valeurs reçues.
+
+    Le gestionnaire par défaut recopie "input" : un NaN ou un Infinity
+    refusé y reste et rend la réponse impossible à sérialiser en JSON (500).
+    """
+    ERREURS.incrementer(service="validation", type=type(exc).__name__)
+    details = [
+        {cle: valeur for cle, valeur in erreur.items() if cle not in ("input", "ctx", "url")}
+        for erreur in exc.errors()
+    ]
+    return JSONResponse(status_code=422, content={"error": "Données invalides", "detail": details})
+
+
+# Routes communes aux deux services
+routeur_metrics = APIRouter()
+
+
+@routeur_metrics.get("/metrics")
+async def metrics():
+    """Métriques au format texte Prometheus."""
+    return PlainTextResponse(REGISTRE.exposition(), media_type="text/plain; version=0.0.4")
+
+
+@routeur_metrics.post("/metrics/profileur")
+async def piloter_profileur(actif: bool, intervalle_ms: float = Query(10, gt=0, le=1000)):
+    """Active ou arrête le profileur par échantillonnage, sans redémarrer le service."""
+    if actif:
+        PROFILEUR.demarrer(intervalle_ms)
+    else:
+        await run_in_threadpool(PROFILEUR.arreter)
+    return PROFILEUR.statut()
+
+
+@routeur_metrics.get("/metrics/profileur", response_class=PlainTextResponse)
+async def resultat_profileur(top: int = Query(200, gt=0)):
+    """Piles les plus fréquentes, au format folded (flamegraph)."""
+    return PROFILEUR.folded(top)
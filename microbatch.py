@@ -0,0 +1,97 @@
+import asyncio
+import os
+
+import numpy as np
+
+# Fenêtre de regroupement des requêtes unitaires
+TAILLE_MAX = int(os.environ.get("MICROBATCH_TAILLE_MAX", "256"))
+ATTENTE_MAX_MS = float(os.environ.get("MICROBATCH_ATTENTE_MS", "2"))
+
+
+class MicroBatcher:
+    """
+    Regroupe les requêtes concurrentes en micro-lots.
+
+    Chaque requête dépose ses lignes (tableau NumPy n x 3) dans une file ;
+    une tâche de fond attend au plus attente_max_ms ou taille_max lignes,
+    score le tout en un seul appel vectorisé hors de la boucle d'événements
+    puis redistribue les résultats à chaque requête.
+    """
+
+    def __init__(self, fonction, taille_max=TAILLE_MAX, attente_max_ms=ATTENTE_MAX_MS):
+        self.fonction = fonction
+        self.taille_max = taille_max
+        self.attente_max = attente_max_ms / 1000
+        self.file = None
+        self.tache = None
+
+    async def demarrer(self):
+        self.file = asyncio.Queue()
+        self.tache = asyncio.create_task(self._boucle())
+
+    async def arreter(self):
+        if self.tache is not None:
+            self.tache.cancel()
+            self.tache = None
+
+    async def soumettre(self, X):
+        """Renvoie (labels, proba_0, proba_1) pour les lignes de X."""
+        futur = asyncio.get_running_loop().create_future()
+        await self.file.put((X, futur))
+        return await futur
+
+    async def _collecter(self):
+        boucle = asyncio.get_running_loop()
+        lot = [await self.file.get()]
+        lignes = len(lot[0][0])
+        echeance = boucle.time() + self.attente_max
+
+        while lignes < self.taille_max:
+            # Ce qui est déjà en file est pris sans attendre
+            if not self.file.empty():
+                element = self.file.get_nowait()
+            else:
+                reste = echeance - boucle.time()
+                if reste <= 0:
+                    break
+                try:
+                    element = await asyncio.wait_for(self.file.get(), reste)
+                except asyncio.TimeoutError:
+                    break
+            lot.append(element)
+            lignes += len(element[0])
+
+        return lot
+
+    async def _boucle(self):
+        boucle = asyncio.get_running_loop()
+        while True:
+            lot = await self._collecter()
+            X = np.concatenate([element[0] for element in lot])
+
+            try:
+                labels, proba_0, proba_1 = await boucle.run_in_executor(None, self.fonction, X)
+            except Exception as e:
+                if len(lot) == 1:
+                    if not lot[0][1].done():
+                        lot[0][1].set_exception(e)
+                    continue
+                # Une requête invalide ne doit pas faire échouer les autres du lot :
+                # chacune est rescorée seule
+                for lignes, futur in lot:
+                    try:
+                        resultat = await boucle.run_in_executor(None, self.fonction, lignes)
+                    except Exception as erreur:
+                        if not futur.done():
+                            futur.set_exception(erreur)
+                    else:
+                        if not futur.done():
+                            futur.set_result(resultat)
+                continue
+
+            debut = 0
+            for lignes, futur in lot:
+                fin = debut + len(lignes)
+                if not futur.done():
+                    futur.set_result((labels[debut:fin], proba_0[debut:fin], proba_1[debut:fin]))
+                debut = fin
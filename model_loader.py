@@ -0,0 +1,233 @@
+"""
+Chargement du modèle, paresseux et partagé entre les workers uvicorn.
+
+Le moteur par défaut, "sklearn", est le pipeline du pickle, chargé avec
+joblib.load(mmap_mode="r") : les tableaux NumPy que joblib stocke à part sont
+projetés en mémoire et partagés entre workers, sauf ceux que scikit-learn
+recopie au chargement (les noeuds des arbres) ; pour un pickle de 572 Ko,
+l'écart est de toute façon négligeable.
+
+Le moteur "compiled" (INFERENCE_BACKEND=compiled) enregistre la forêt aplatie
+de forest.py une fois dans model_bundle/ : un fichier .npy par tableau et un
+meta.json lié à l'empreinte de model_detection_faux_billets.pkl, ouverts avec
+np.load(mmap_mode="r"). Le bundle est reconstruit automatiquement quand le
+pickle change, sous verrou de fichier pour qu'un seul worker s'en charge.
+Ce moteur n'est pas le défaut : voir benchmarks/bench_foret.py pour son
+débit par rapport à scikit-learn.
+
+scikit-learn et joblib ne sont importés qu'au besoin : construction du
+bundle, moteur "sklearn", ou repli pour les entrées contenant des NaN.
+
+Construction à l'avance :
+    python model_loader.py
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from forest import ForetCompilee, NonSupporte, TOLERANCE, verifier
+from reference_profile import empreinte_fichier
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CHEMIN_MODELE = "model_detection_faux_billets.pkl"
+DOSSIER_BUNDLE = os.environ.get("MODELE_BUNDLE", "model_bundle")
+CHEMIN_REFERENCE = "billets.csv"
+
+# Moteur d'inférence : "sklearn" (pipeline tel quel, défaut) ou "compiled" (forêt aplatie, mmap)
+BACKEND = os.environ.get("INFERENCE_BACKEND", "sklearn")
+
+TABLEAUX = ("moyenne", "echelle", "feature", "seuil", "gauche", "droite", "valeurs", "racines", "classes_")
+
+
+class PipelineParesseux:
+    """Pipeline scikit-learn chargé seulement au premier appel (repli de la forêt compilée)."""
+
+    def __init__(self, chemin_modele):
+        self.chemin_modele = chemin_modele
+        self.verrou = threading.Lock()
+        self._pipeline = None
+
+    @property
+    def pipeline(self):
+        with self.verrou:
+            if self._pipeline is None:
+                import joblib
+                self._pipeline = joblib.load(self.chemin_modele)
+        return self._pipeline
+
+    def predict_proba(self, X):
+        return self.pipeline.predict_proba(X)
+
+
+def lire_meta(dossier):
+    try:
+        with open(os.path.join(dossier, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def construire_bundle(chemin_modele, dossier=DOSSIER_BUNDLE, chemin_reference=CHEMIN_REFERENCE, empreinte=None):
+    """
+    Aplatit la forêt du pickle, la vérifie sur billets.csv et l'écrit dans dossier.
+
+    Un modèle non supporté ou en désaccord avec predict_proba est aussi
+    enregistré (valide = false) pour ne pas refaire la tentative à chaque
+    démarrage.
+    """
+    import joblib
+    from inference import donnees_reference
+
+    empreinte = empreinte or empreinte_fichier(chemin_modele)
+    pipeline = joblib.load(chemin_modele)
+    meta = {"empreinte_modele": empreinte, "valide": False}
+
+    temporaire = f"{dossier}.{os.getpid()}.tmp"
+    shutil.rmtree(temporaire, ignore_errors=True)
+    os.makedirs(temporaire)
+
+    try:
+        foret = ForetCompilee.depuis_pipeline(pipeline)
+    except NonSupporte as e:
+        meta["raison"] = str(e)
+    else:
+        identique, ecart = verifier(foret, pipeline, donnees_reference(chemin_reference))
+        meta.update({
+            "valide": identique or ecart <= TOLERANCE,
+            "identique_bit_a_bit": identique,
+            "ecart_max": ecart,
+            "profondeur": foret.profondeur,
+            "noms_colonnes": foret.noms_colonnes
+        })
+        for nom in TABLEAUX:
+            np.save(os.path.join(temporaire, f"{nom}.npy"), getattr(foret, nom))
+
+    with open(os.path.join(temporaire, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    # Remplacement du bundle précédent en une opération
+    ancien = f"{dossier}.{os.getpid()}.ancien"
+    if os.path.exists(dossier):
+        os.rename(dossier, ancien)
+    os.rename(temporaire, dossier)
+    shutil.rmtree(ancien, ignore_errors=True)
+    return meta
+
+
+def charger_bundle(dossier=DOSSIER_BUNDLE, mmap=True):
+    meta = lire_meta(dossier)
+    tableaux = {
+        nom: np.load(os.path.join(dossier, f"{nom}.npy"), mmap_mode="r" if mmap else None)
+        for nom in TABLEAUX
+    }
+    classes = tableaux.pop("classes_")
+    return ForetCompilee(
+        classes=np.asarray(classes),
+        profondeur=meta["profondeur"],
+        noms_colonnes=meta["noms_colonnes"],
+        **tableaux
+    )
+
+
+def bundle_a_jour(chemin_modele, dossier=DOSSIER_BUNDLE):
+    """Reconstruit le bundle si absent ou lié à un autre pickle ; renvoie son meta."""
+    empreinte = empreinte_fichier(chemin_modele)
+    meta = lire_meta(dossier)
+    if meta is not None and meta["empreinte_modele"] == empreinte:
+        return meta
+
+    verrou = open(f"{dossier}.lock", "w")
+    try:
+        if fcntl is not None:
+            fcntl.flock(verrou, fcntl.LOCK_EX)
+        # Un autre worker a pu le construire pendant l'attente du verrou
+        meta = lire_meta(dossier)
+        if meta is None or meta["empreinte_modele"] != empreinte:
+            meta = construire_bundle(chemin_modele, dossier, empreinte=empreinte)
+    finally:
+        verrou.close()
+    return meta
+
+
+class ChargeurModele:
+    """
+    Donne accès au moteur de scoring (predict_proba + classes_), chargé au premier usage.
+
+    charger() peut être lancé en arrière-plan au démarrage : pret passe à
+    True quand le moteur est utilisable (voir GET /ready).
+    """
+
+    def __init__(self, chemin_modele=CHEMIN_MODELE, backend=BACKEND, dossier_bundle=DOSSIER_BUNDLE):
+        self.chemin_modele = chemin_modele
+        self.backend = backend
+        self.dossier_bundle = dossier_bundle
+        self.verrou = threading.Lock()
+        self._moteur = None
+        self.backend_effectif = None
+        self.duree_chargement = None
+        self.erreur = None
+
+    @property
+    def pret(self):
+        return self._moteur is not None
+
+    @property
+    def moteur(self):
+        if self._moteur is None:
+            self.charger()
+        return self._moteur
+
+    def charger(self):
+        with self.verrou:
+            if self._moteur is None:
+                debut = time.perf_counter()
+                try:
+                    self._moteur = self._charger()
+                except Exception as e:
+                    self.erreur = str(e)
+                    raise
+                self.erreur = None
+                self.duree_chargement = time.perf_counter() - debut
+        return self._moteur
+
+    def _charger(self):
+        if self.backend == "compiled":
+            meta = bundle_a_jour(self.chemin_modele, self.dossier_bundle)
+            if meta["valide"]:
+                foret = charger_bundle(self.dossier_bundle)
+                foret.repli = PipelineParesseux(self.chemin_modele)
+                self.backend_effectif = "compiled"
+                return foret
+            logger.warning(
+                "Forêt compilée indisponible, repli sur scikit-learn : %s",
+                meta.get("raison", f"écart maximal {meta.get('ecart_max')}")
+            )
+
+        import joblib
+        self.backend_effectif = "sklearn"
+        # Sans effet (avec un avertissement de joblib) si le pickle est compressé
+        return joblib.load(self.chemin_modele, mmap_mode="r")
+
+    def etat(self):
+        return {
+            "pret": self.pret,
+            "backend": self.backend_effectif,
+            "duree_chargement_s": None if self.duree_chargement is None else round(self.duree_chargement, 4),
+            "erreur": self.erreur
+        }
+
+
+if __name__ == "__main__":
+    # Construction du bundle à l'avance (image Docker, déploiement)
+    print(json.dumps(bundle_a_jour(CHEMIN_MODELE), indent=2))
@@ -1,31 +1,129 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import APIRouter, FastAPI, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, JSONResponse, Response
 import pandas as pd
-import joblib
+import json
+import time
+from functools import lru_cache
 from io import StringIO
-from evidently import Report
-from evidently.metrics import ValueDrift, MissingValueCount, RowCount
+
+from inference import ColonnesManquantes, scorer, resume, charger_imputation, imputer
+from reference_profile import charger_profil
+from rapports import GestionnaireRapports, NOM_VALIDE, executer_evidently
+from live_monitoring import MoteurDeriveLive
+from cache import CacheResultats
+from model_loader import CHEMIN_MODELE
+from registry import REGISTRE, mesurer
+from metrics import (
+    DUREE_ETAPE, DUREE_REQUETE, LIGNES, OCTETS, erreur_validation, etape, reponse_erreur, routeur_metrics
+)
 
 app = FastAPI()
+app.include_router(routeur_metrics)
+app.add_exception_handler(RequestValidationError, erreur_validation)
+
+# Routes du monitoring, et routes d'état dont les chemins existent aussi côté
+# API : service.py monte ces dernières sous /monitoring
+routeur_monitoring = APIRouter()
+routeur_statut = APIRouter()
+
+SERVICE = "monitoring"
 
-# Charger modèle
-pipeline_rf = joblib.load("model_detection_faux_billets.pkl")
+# Le modèle principal du registre n'est chargé que si une requête demande les
+# prédictions ; le monitoring ne participe pas au routage A/B
+
+# Résultats déjà calculés, par contenu de fichier et version du modèle
+cache_resultats = CacheResultats(CHEMIN_MODELE)
 
-# Charger référence
-billets = pd.read_csv("billets.csv", sep=";")
 columns_to_monitor = ["margin_low", "margin_up", "length"]
-billets_features = billets[columns_to_monitor]
 
-@app.post("/monitoring/")
-async def monitoring(file: UploadFile = File(...)):
+# Profil de référence précalculé (reference_profile.npz)
+profil_reference = charger_profil()
+
+# Médianes d'imputation de référence (imputation_reference.json)
+charger_imputation()
+
+# Dérive en continu sur le journal des prédictions de l'API
+moteur_live = MoteurDeriveLive(profil_reference)
+
+# Rapports HTML Evidently, rendus en arrière-plan sur demande
+gestionnaire_rapports = GestionnaireRapports("billets.csv", columns_to_monitor)
+
+
+@lru_cache(maxsize=1)
+def billets_features():
+    """Référence brute, lue seulement pour le moteur Evidently."""
+    billets = pd.read_csv("billets.csv", sep=";")
+    return billets[columns_to_monitor]
+
+
+def rapport_evidently(current_features):
+    """Rapport Evidently complet (JSON), calculé hors de la boucle d'événements."""
+    snapshot = executer_evidently(billets_features(), current_features, columns_to_monitor)
+    # json() convertit les types NumPy du snapshot, contrairement à dict()
+    return json.loads(snapshot.json())
+
+
+@routeur_monitoring.on_event("startup")
+def demarrer_rapports():
+    gestionnaire_rapports.demarrer()
+
+
+@routeur_monitoring.on_event("startup")
+async def demarrer_surveillance():
+    # Suit les rechargements du registre demandés à l'API
+    REGISTRE.demarrer_surveillance()
+
+
+@routeur_monitoring.on_event("shutdown")
+def arreter_rapports():
+    gestionnaire_rapports.arreter()
+
+
+@routeur_monitoring.post("/monitoring/")
+async def monitoring(
+    file: UploadFile = File(...),
+    moteur: str = Query("profil", pattern="^(profil|evidently)$"),
+    rapport_html: bool = False,
+    predictions: bool = False
+):
+    debut = time.perf_counter()
     try:
         # Charger nouveau fichier
-        content = await file.read()
-        text_data = content.decode("utf-8")
+        with etape(SERVICE, "lecture"):
+            content = await file.read()
+        OCTETS.incrementer(len(content), service=SERVICE)
+
+        # Même fichier, mêmes options, même modèle et même référence : résultat en cache
+        with etape(SERVICE, "cache"):
+            # Modèle principal du registre (il peut avoir été rechargé), seulement s'il sert
+            version = await run_in_threadpool(REGISTRE.version_principale) if predictions else None
+            cle = await run_in_threadpool(
+                cache_resultats.cle, content, "monitoring", moteur, predictions, profil_reference.empreinte,
+                charger_imputation().empreinte, None if version is None else version.empreinte
+            )
+            corps = await run_in_threadpool(cache_resultats.lire, cle)
+        if corps is not None:
+            if not rapport_html:
+                return Response(corps, media_type="application/json")
+            # Le rapport HTML peut avoir été évincé : on ne le réutilise que s'il existe
+            statut = gestionnaire_rapports.statut(
+                GestionnaireRapports.nom(content, profil_reference.empreinte)
+            )
+            if statut["statut"] in ("pret", "en_cours"):
+                resultat = json.loads(corps)
+                resultat["rapport_html"] = statut
+                return resultat
+
+        with etape(SERVICE, "decodage"):
+            text_data = content.decode("utf-8")
 
-        if ";" in text_data:
-            df = pd.read_csv(StringIO(text_data), sep=";")
-        else:
-            df = pd.read_csv(StringIO(text_data))
+        with etape(SERVICE, "read_csv"):
+            if ";" in text_data:
+                df = pd.read_csv(StringIO(text_data), sep=";")
+            else:
+                df = pd.read_csv(StringIO(text_data))
 
         # Nettoyage des colonnes : supprimer espaces et mettre en minuscules
         df.columns = df.columns.str.strip().str.lower()
@@ -33,37 +131,89 @@ async def monitoring(file: UploadFile = File(...)):
         # Vérifier colonnes
         colonnes_manquantes = [col for col in columns_to_monitor if col not in df.columns]
         if colonnes_manquantes:
-            return {
-                "error": f"Les colonnes suivantes sont manquantes : {', '.join(colonnes_manquantes)}"
-            }
+            raise ColonnesManquantes(
+                f"Les colonnes suivantes sont manquantes : {', '.join(colonnes_manquantes)}"
+            )
 
-        # Sélectionner colonnes utiles
-        current_features = df[columns_to_monitor].copy()
-        current_features["margin_low"] = current_features["margin_low"].fillna(
-            current_features["margin_low"].median()
-        )
+        # Sélectionner colonnes utiles, imputation de référence (celle du modèle)
+        with etape(SERVICE, "imputation"):
+            current_features = imputer(df[columns_to_monitor])
+        LIGNES.incrementer(len(current_features), service=SERVICE)
 
-        # Prédictions
-        predictions = pipeline_rf.predict(current_features)
-        current_features["prediction"] = predictions  # ajout mais pas pour Evidently
+        # Résultats JSON renvoyés tout de suite
+        with etape(SERVICE, "derive"):
+            if moteur == "profil":
+                resultat = profil_reference.rapport(current_features)
+            else:
+                resultat = await run_in_threadpool(rapport_evidently, current_features)
 
-        # Créer métriques Evidently
-        metrics_list = [ValueDrift(column_name=col) for col in columns_to_monitor]
-        metrics_list += [MissingValueCount(), RowCount()]
+        # Prédictions seulement sur demande : elles n'entrent pas dans la dérive
+        if predictions:
+            debut_inference = time.perf_counter()
+            labels, _, _ = await run_in_threadpool(mesurer, version, "monitoring", scorer, current_features)
+            DUREE_ETAPE.observer(time.perf_counter() - debut_inference, service=SERVICE, etape="inference")
+            resultat["predictions"] = resume(labels)
 
-        report = Report(metrics=metrics_list)
+        with etape(SERVICE, "serialisation"):
+            corps = json.dumps(resultat, ensure_ascii=False).encode("utf-8")
+        await run_in_threadpool(cache_resultats.ecrire, cle, corps)
 
-        # Passer uniquement les colonnes surveillées
-        report.run(
-            reference_data=billets_features,
-            current_data=current_features[columns_to_monitor]
-        )
+        # Rapport HTML sur demande, rendu en arrière-plan sous un nom dérivé du contenu
+        if rapport_html:
+            nom = GestionnaireRapports.nom(content, profil_reference.empreinte)
+            resultat["rapport_html"] = gestionnaire_rapports.demander(nom, current_features)
+            return resultat
 
-        # Sauvegarde HTML
-        report.save_html("monitoring_report.html")
-
-        # Retourner résultats JSON
-        return report.as_dict()
+        return Response(corps, media_type="application/json")
 
     except Exception as e:
-        return {"error": str(e)}
+        return reponse_erreur(SERVICE, e)
+
+    finally:
+        DUREE_REQUETE.observer(time.perf_counter() - debut, service=SERVICE)
+
+
+@routeur_monitoring.get("/monitoring/rapports/{nom}")
+async def rapport_monitoring(nom: str):
+    if not NOM_VALIDE.match(nom):
+        return JSONResponse(status_code=404, content={"error": "Rapport inconnu"})
+
+    statut = gestionnaire_rapports.statut(nom)
+    if statut["statut"] == "pret":
+        return FileResponse(gestionnaire_rapports.chemin(nom), media_type="text/html")
+    if statut["statut"] == "en_cours":
+        return JSONResponse(status_code=202, content=statut)
+    if statut["statut"] == "erreur":
+        return JSONResponse(status_code=500, content=statut)
+    return JSONResponse(status_code=404, content={"error": "Rapport inconnu"})
+
+
+@routeur_monitoring.get("/monitoring/live")
+async def monitoring_live():
+    """Dérive et taux de faux billets sur le flux des prédictions, mis à jour incrémentalement."""
+    await run_in_threadpool(moteur_live.rafraichir)
+    return moteur_live.etat()
+
+
+@routeur_statut.get("/cache/stats")
+async def stats_cache():
+    return cache_resultats.stats()
+
+
+@routeur_statut.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@routeur_statut.get("/ready")
+async def ready():
+    # Le profil de référence est chargé à l'import ; le modèle reste paresseux
+    return {
+        "pret": True,
+        "profil_reference": profil_reference.empreinte[:12],
+        "modeles": REGISTRE.etat()
+    }
+
+
+app.include_router(routeur_monitoring)
+app.include_router(routeur_statut)
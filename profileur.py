@@ -0,0 +1,78 @@
+"""
+Profileur par échantillonnage activable à chaud (POST /metrics/profileur).
+
+Un thread relève la pile de tous les autres threads à intervalle régulier
+et compte les piles identiques. Désactivé, il ne coûte rien ; activé, le
+coût est borné par l'intervalle d'échantillonnage. Le résultat est au
+format « folded » (une pile par ligne, fonctions séparées par « ; »),
+lisible par flamegraph.pl ou speedscope.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+PROFONDEUR_MAX = 64
+
+
+class ProfileurEchantillonnage:
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.piles = Counter()
+        self.echantillons = 0
+        self.intervalle = 0.01
+        self.thread = None
+        self.arret = threading.Event()
+
+    @property
+    def actif(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def demarrer(self, intervalle_ms=10):
+        with self.verrou:
+            if self.actif:
+                return
+            self.intervalle = intervalle_ms / 1000
+            self.piles.clear()
+            self.echantillons = 0
+            self.arret.clear()
+            self.thread = threading.Thread(target=self._boucle, name="profileur", daemon=True)
+            self.thread.start()
+
+    def arreter(self):
+        self.arret.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        self.thread = None
+
+    def _boucle(self):
+        moi = threading.get_ident()
+        while not self.arret.wait(self.intervalle):
+            for ident, cadre in sys._current_frames().items():
+                if ident == moi:
+                    continue
+                pile = []
+                while cadre is not None and len(pile) < PROFONDEUR_MAX:
+                    code = cadre.f_code
+                    pile.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{cadre.f_lineno}")
+                    cadre = cadre.f_back
+                with self.verrou:
+                    self.piles[";".join(reversed(pile))] += 1
+            with self.verrou:
+                self.echantillons += 1
+
+    def statut(self):
+        return {
+            "actif": self.actif,
+            "intervalle_ms": self.intervalle * 1000,
+            "echantillons": self.echantillons
+        }
+
+    def folded(self, top=None):
+        with self.verrou:
+            piles = self.piles.most_common(top)
+        return "".join(f"{pile} {compte}\n" for pile, compte in piles)
+
+
+PROFILEUR = ProfileurEchantillonnage()
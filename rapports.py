@@ -0,0 +1,139 @@
+"""
+Rapports HTML Evidently de /monitoring/, rendus en arrière-plan.
+
+Le nom du fichier est dérivé du contenu (empreinte des données envoyées et
+du profil de référence) : deux envois identiques partagent le même rapport
+et deux appels concurrents n'écrivent jamais dans le même fichier
+temporaire. Les rapports les plus anciens sont supprimés au-delà de
+RAPPORTS_MAX fichiers ou de RAPPORTS_RETENTION_S secondes.
+"""
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+DOSSIER_RAPPORTS = os.environ.get("RAPPORTS_DOSSIER", "rapports")
+MAX_RAPPORTS = int(os.environ.get("RAPPORTS_MAX", "50"))
+RETENTION_S = int(os.environ.get("RAPPORTS_RETENTION_S", str(7 * 24 * 3600)))
+MAX_WORKERS = int(os.environ.get("RAPPORTS_WORKERS", "1"))
+
+# Pas de fork depuis un processus qui a déjà des threads (voir jobs.CONTEXTE)
+CONTEXTE = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+NOM_VALIDE = re.compile(r"^monitoring_[0-9a-f]{32}\.html$")
+
+
+def executer_evidently(reference, courant, colonnes):
+    """
+    Exécute le rapport Evidently (API >= 0.7) et renvoie le Snapshot.
+
+    Report.run() renvoie un Snapshot : c'est lui, et non le Report, qui
+    porte save_html() et json().
+    """
+    from evidently import Report
+    from evidently.metrics import ValueDrift, MissingValueCount, RowCount
+
+    metrics_list = [ValueDrift(column=col) for col in colonnes]
+    metrics_list += [MissingValueCount(column=col) for col in colonnes]
+    metrics_list += [RowCount()]
+
+    report = Report(metrics=metrics_list)
+    return report.run(reference_data=reference[colonnes], current_data=courant[colonnes])
+
+
+def rendre_rapport(chemin_reference, colonnes, courant, chemin_sortie):
+    """Construit le rapport Evidently et l'écrit de façon atomique (processus du pool)."""
+    import pandas as pd
+
+    reference = pd.read_csv(chemin_reference, sep=";")
+    snapshot = executer_evidently(reference, courant, colonnes)
+
+    temporaire = f"{chemin_sortie}.{os.getpid()}.tmp"
+    snapshot.save_html(temporaire)
+    os.replace(temporaire, chemin_sortie)
+
+
+class GestionnaireRapports:
+
+    def __init__(self, chemin_reference, colonnes, dossier=DOSSIER_RAPPORTS,
+                 max_rapports=MAX_RAPPORTS, retention_s=RETENTION_S, max_workers=MAX_WORKERS):
+        self.chemin_reference = chemin_reference
+        self.colonnes = colonnes
+        self.dossier = dossier
+        self.max_rapports = max_rapports
+        self.retention_s = retention_s
+        self.max_workers = max_workers
+        self.verrou = threading.Lock()
+        self.en_cours = {}
+        self.erreurs = {}
+        self.executeur = None
+
+    def demarrer(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        self.executeur = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=CONTEXTE)
+
+    def arreter(self):
+        if self.executeur is not None:
+            self.executeur.shutdown(wait=False, cancel_futures=True)
+            self.executeur = None
+
+    @staticmethod
+    def nom(contenu, empreinte_reference):
+        sha = hashlib.sha256(contenu)
+        sha.update(empreinte_reference.encode())
+        return f"monitoring_{sha.hexdigest()[:32]}.html"
+
+    def chemin(self, nom):
+        return os.path.join(self.dossier, nom)
+
+    def demander(self, nom, courant):
+        """Planifie le rendu s'il n'existe ni sur disque ni en cours ; ne bloque pas."""
+        with self.verrou:
+            if nom in self.en_cours or os.path.exists(self.chemin(nom)):
+                return self.statut(nom)
+            self.erreurs.pop(nom, None)
+            futur = self.executeur.submit(
+                rendre_rapport, self.chemin_reference, self.colonnes, courant, self.chemin(nom)
+            )
+            self.en_cours[nom] = futur
+        futur.add_done_callback(lambda f: self._termine(nom, f))
+        return self.statut(nom)
+
+    def _termine(self, nom, futur):
+        with self.verrou:
+            self.en_cours.pop(nom, None)
+            if futur.cancelled():
+                return
+            if futur.exception() is not None:
+                self.erreurs[nom] = str(futur.exception())
+        self.purger()
+
+    def statut(self, nom):
+        if nom in self.en_cours:
+            statut = "en_cours"
+        elif os.path.exists(self.chemin(nom)):
+            statut = "pret"
+        elif nom in self.erreurs:
+            return {"statut": "erreur", "error": self.erreurs[nom]}
+        else:
+            statut = "inconnu"
+        return {"statut": statut, "url": f"/monitoring/rapports/{nom}"}
+
+    def purger(self):
+        rapports = sorted(
+            glob.glob(os.path.join(self.dossier, "monitoring_*.html")), key=os.path.getmtime
+        )
+        limite = time.time() - self.retention_s
+        en_trop = len(rapports) - self.max_rapports
+        for i, chemin in enumerate(rapports):
+            if i < en_trop or os.path.getmtime(chemin) < limite:
+                try:
+                    os.remove(chemin)
+                except OSError:
+                    pass
@@ -0,0 +1,179 @@
+"""
+Profil de référence pour /monitoring/.
+
+Les statistiques de billets.csv utiles aux tests de dérive (échantillon trié,
+valeurs uniques, écart-type, bornes des bins du suivi en continu) sont
+calculées une fois puis enregistrées dans reference_profile.npz. Chaque
+requête ne trie ensuite que les données courantes : elles sont fusionnées
+avec la référence déjà triée par searchsorted, sans retrier l'ensemble.
+
+Les tests reprennent le choix par défaut de ValueDrift (Evidently) :
+- référence > 1000 lignes : distance de Wasserstein normalisée, seuil 0.1
+- référence <= 1000 lignes : Kolmogorov-Smirnov, seuil p-value 0.05
+
+Construction à l'avance :
+    python reference_profile.py
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from inference import COLONNES_UTILES
+
+CHEMIN_REFERENCE = "billets.csv"
+CHEMIN_PROFIL = "reference_profile.npz"
+
+N_BINS = 30
+
+# Valeurs par défaut d'Evidently
+SEUIL_WASSERSTEIN = 0.1
+SEUIL_KS = 0.05
+TAILLE_MIN_WASSERSTEIN = 1000
+N_UNIQUES_MIN = 5
+
+
+def empreinte_fichier(chemin):
+    sha = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+class ProfilReference:
+
+    def __init__(self, colonnes, empreinte):
+        # colonne -> dict de tableaux NumPy
+        self.colonnes = colonnes
+        self.empreinte = empreinte
+
+    @classmethod
+    def construire(cls, reference, empreinte=""):
+        colonnes = {}
+        for col in COLONNES_UTILES:
+            valeurs = reference[col].replace([np.inf, -np.inf], np.nan)
+            tri = np.sort(valeurs.dropna().to_numpy(dtype=np.float64))
+            colonnes[col] = {
+                "tri": tri,
+                "uniques": np.unique(tri),
+                "ecart_type": np.float64(np.std(tri)),
+                # Bins du suivi en continu (live_monitoring)
+                "bornes": np.histogram_bin_edges(tri, bins=N_BINS)
+            }
+        return cls(colonnes, empreinte)
+
+    def enregistrer(self, chemin=CHEMIN_PROFIL):
+        tableaux = {"empreinte": np.array(self.empreinte)}
+        for col, stats in self.colonnes.items():
+            for nom, valeur in stats.items():
+                tableaux[f"{col}__{nom}"] = valeur
+        np.savez(chemin, **tableaux)
+
+    @classmethod
+    def charger(cls, chemin=CHEMIN_PROFIL):
+        with np.load(chemin) as donnees:
+            colonnes = {}
+            for cle in donnees.files:
+                if cle == "empreinte":
+                    continue
+                col, nom = cle.split("__", 1)
+                colonnes.setdefault(col, {})[nom] = donnees[cle]
+            return cls(colonnes, str(donnees["empreinte"]))
+
+    def derive(self, col, courant):
+        """
+        Test de dérive d'une colonne contre le profil, sans repasser sur la référence brute.
+
+        Retour :
+        - dict avec la méthode, le seuil, la valeur et drift_detected
+        """
+        stats = self.colonnes[col]
+        reference = stats["tri"]
+        courant = np.asarray(courant, dtype=np.float64)
+        courant = np.sort(courant[np.isfinite(courant)])
+
+        if len(courant) == 0:
+            raise ValueError(f"Aucune valeur exploitable pour {col}")
+
+        n_uniques = len(np.union1d(stats["uniques"], courant))
+        if n_uniques <= N_UNIQUES_MIN:
+            raise ValueError(f"Colonne {col} quasi catégorielle : test non pris en charge par le profil")
+
+        if len(reference) > TAILLE_MIN_WASSERSTEIN:
+            norme = max(float(stats["ecart_type"]), 0.001)
+            valeur = wasserstein_tries(reference, courant) / norme
+            return {
+                "method": "Wasserstein distance (normed)",
+                "threshold": SEUIL_WASSERSTEIN,
+                "value": valeur,
+                "drift_detected": bool(valeur >= SEUIL_WASSERSTEIN)
+            }
+
+        from scipy.stats import ks_2samp
+        p_value = float(ks_2samp(reference, courant)[1])
+        return {
+            "method": "K-S p_value",
+            "threshold": SEUIL_KS,
+            "value": p_value,
+            "drift_detected": bool(p_value < SEUIL_KS)
+        }
+
+    def rapport(self, courant):
+        """Résultats JSON de /monitoring/ : ValueDrift par colonne, valeurs manquantes, lignes."""
+        metrics = []
+        for col in COLONNES_UTILES:
+            resultat = {"metric": "ValueDrift", "column": col}
+            resultat.update(self.derive(col, courant[col].to_numpy()))
+            metrics.append(resultat)
+
+        manquants = int(courant[COLONNES_UTILES].isnull().to_numpy().sum())
+        cellules = courant[COLONNES_UTILES].size
+        metrics.append({
+            "metric": "MissingValueCount",
+            "count": manquants,
+            "share": manquants / cellules if cellules else 0.0
+        })
+        metrics.append({"metric": "RowCount", "value": int(len(courant))})
+        return {"metrics": metrics}
+
+
+def wasserstein_tries(u, v):
+    """
+    Distance de Wasserstein 1D entre deux échantillons déjà triés.
+
+    Même calcul que scipy.stats.wasserstein_distance (intégrale de
+    l'écart entre les deux fonctions de répartition), sans les argsort :
+    les deux échantillons sont fusionnés en plaçant chaque valeur à son
+    rang dans l'autre (searchsorted), en O(n log n) sans tri de n_u + n_v.
+    """
+    tous = np.empty(len(u) + len(v), dtype=np.float64)
+    # À égalité, les valeurs de u passent avant celles de v : positions toutes distinctes
+    tous[np.arange(len(u)) + np.searchsorted(v, u, side="left")] = u
+    tous[np.arange(len(v)) + np.searchsorted(u, v, side="right")] = v
+    deltas = np.diff(tous)
+    cdf_u = np.searchsorted(u, tous[:-1], side="right") / len(u)
+    cdf_v = np.searchsorted(v, tous[:-1], side="right") / len(v)
+    return float(np.sum(np.abs(cdf_u - cdf_v) * deltas))
+
+
+def charger_profil(chemin_reference=CHEMIN_REFERENCE, chemin_profil=CHEMIN_PROFIL):
+    """
+    Charge le profil enregistré, ou le (re)construit si billets.csv a changé.
+    """
+    empreinte = empreinte_fichier(chemin_reference)
+    if os.path.exists(chemin_profil):
+        profil = ProfilReference.charger(chemin_profil)
+        if profil.empreinte == empreinte:
+            return profil
+
+    reference = pd.read_csv(chemin_reference, sep=";")
+    profil = ProfilReference.construire(reference, empreinte)
+    profil.enregistrer(chemin_profil)
+    return profil
+
+
+if __name__ == "__main__":
+    profil = charger_profil()
+    print(f"Profil enregistré dans {CHEMIN_PROFIL} ({profil.empreinte[:12]})")
@@ -0,0 +1,318 @@
+"""
+Registre des modèles servis : modèle principal, candidats A/B et modèles en ombre.
+
+La configuration est lue dans registre_modeles.json (REGISTRE_CONFIG) ;
+sans fichier, seul le modèle principal est servi :
+
+    {
+        "principal": {"nom": "random_forest", "chemin": "model_detection_faux_billets.pkl"},
+        "candidats": [
+            {"nom": "logistique", "chemin": "model_logistique.pkl", "part": 0.1, "mode": "routage"},
+            {"nom": "kmeans", "chemin": "model_kmeans.pkl", "mode": "ombre"}
+        ]
+    }
+
+- mode "routage" : la part indiquée des requêtes reçoit la réponse du candidat
+- mode "ombre" : le candidat score les mêmes données en arrière-plan, après
+  la réponse, sans effet sur la latence ; seuls ses temps et son taux de
+  désaccord avec le modèle servi sont enregistrés
+
+Chaque rechargement construit une nouvelle version complète (chargement,
+bundle, vérification) puis la publie d'une seule affectation sous verrou :
+les requêtes en cours gardent la version qu'elles ont prise, aucune n'est
+interrompue.
+
+Avec plusieurs workers uvicorn, chaque processus a son registre. POST
+/models/reload recharge le worker qui le reçoit et réécrit le fichier
+REGISTRE_GENERATION ; les autres workers (et le service de monitoring)
+le voient à leur prochaine vérification, toutes les REGISTRE_SURVEILLANCE_S
+secondes, comme un artefact ou une configuration modifiés.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from metrics import REGISTRE as REGISTRE_METRIQUES
+from model_loader import CHEMIN_MODELE, DOSSIER_BUNDLE, ChargeurModele
+from reference_profile import empreinte_fichier
+
+logger = logging.getLogger(__name__)
+
+CHEMIN_CONFIG = os.environ.get("REGISTRE_CONFIG", "registre_modeles.json")
+# Fichier réécrit à chaque POST /models/reload, surveillé par tous les workers
+CHEMIN_GENERATION = os.environ.get("REGISTRE_GENERATION", "registre_modeles.generation")
+# Intervalle de vérification des artefacts pour le rechargement automatique (0 : désactivé)
+SURVEILLANCE_S = float(os.environ.get("REGISTRE_SURVEILLANCE_S", "10"))
+# Lots en attente de scoring en ombre au-delà desquels on abandonne (pas d'accumulation)
+MAX_OMBRE_EN_ATTENTE = int(os.environ.get("REGISTRE_MAX_OMBRE", "8"))
+
+DUREE_MODELE = REGISTRE_METRIQUES.histogramme(
+    "billets_modele_inference_secondes", "Durée d'inférence par modèle et par rôle",
+    etiquettes=("modele", "role")
+)
+LIGNES_MODELE = REGISTRE_METRIQUES.compteur(
+    "billets_modele_lignes_total", "Lignes scorées par modèle et par rôle", etiquettes=("modele", "role")
+)
+DESACCORDS_OMBRE = REGISTRE_METRIQUES.compteur(
+    "billets_ombre_desaccords_total", "Lignes où le modèle en ombre contredit le modèle servi",
+    etiquettes=("modele",)
+)
+OMBRE_ABANDONS = REGISTRE_METRIQUES.compteur(
+    "billets_ombre_abandons_total", "Lots non scorés en ombre faute de capacité", etiquettes=("modele",)
+)
+
+
+class SansProba:
+    """Adapte un modèle sans predict_proba (KMeans) : probabilité 1 pour la classe prédite."""
+
+    def __init__(self, modele):
+        self.modele = modele
+        n_classes = getattr(modele, "n_clusters", None)
+        if n_classes is None:
+            n_classes = getattr(modele[-1], "n_clusters", 2)
+        self.classes_ = np.arange(n_classes)
+
+    def predict_proba(self, X):
+        labels = np.asarray(self.modele.predict(X))
+        proba = np.zeros((len(labels), len(self.classes_)))
+        proba[np.arange(len(labels)), labels] = 1.0
+        return proba
+
+
+class VersionModele:
+
+    def __init__(self, nom, chemin, part=0.0, mode="routage"):
+        self.nom = nom
+        self.chemin = chemin
+        self.part = float(part)
+        self.mode = mode
+        self.empreinte = empreinte_fichier(chemin)
+        dossier_bundle = DOSSIER_BUNDLE if chemin == CHEMIN_MODELE else f"{DOSSIER_BUNDLE}_{nom}"
+        self.chargeur = ChargeurModele(chemin, dossier_bundle=dossier_bundle)
+        self.charge_le = None
+        self._adaptateur = None
+
+    def charger(self):
+        moteur = self.chargeur.charger()
+        if not hasattr(moteur, "predict_proba"):
+            self._adaptateur = SansProba(moteur)
+        self.charge_le = time.strftime("%Y-%m-%dT%H:%M:%S")
+        return self
+
+    @property
+    def moteur(self):
+        return self._adaptateur or self.chargeur.moteur
+
+    def etat(self):
+        return {
+            "nom": self.nom,
+            "chemin": self.chemin,
+            "empreinte": self.empreinte[:12],
+            "part": self.part,
+            "mode": self.mode,
+            "charge_le": self.charge_le,
+            **self.chargeur.etat()
+        }
+
+
+def mesurer(version, role, fonction, X):
+    """Appelle fonction(version.moteur, X) et enregistre la durée pour ce modèle."""
+    debut = time.perf_counter()
+    resultat = fonction(version.moteur, X)
+    DUREE_MODELE.observer(time.perf_counter() - debut, modele=version.nom, role=role)
+    LIGNES_MODELE.incrementer(len(X), modele=version.nom, role=role)
+    return resultat
+
+
+class RegistreModeles:
+
+    def __init__(self, chemin_config=CHEMIN_CONFIG, chemin_generation=CHEMIN_GENERATION):
+        self.chemin_config = chemin_config
+        self.chemin_generation = chemin_generation
+        self.verrou = threading.Lock()
+        self.verrou_rechargement = threading.Lock()
+        self.principal = None
+        self.candidats = []
+        self.signature_config = None
+        self.executeur_ombre = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ombre")
+        self.ombre_en_attente = 0
+        self.surveillance = None
+
+    def _signature_config(self):
+        signature = []
+        for chemin in (self.chemin_config, self.chemin_generation):
+            try:
+                stat = os.stat(chemin)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def signaler_rechargement(self):
+        """Demande aux autres processus de recharger (voir verifier_artefacts)."""
+        temporaire = f"{self.chemin_generation}.{os.getpid()}.tmp"
+        with open(temporaire, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temporaire, self.chemin_generation)
+
+    def _config(self):
+        if os.path.exists(self.chemin_config):
+            with open(self.chemin_config) as f:
+                return json.load(f)
+        return {"principal": {"nom": "random_forest", "chemin": CHEMIN_MODELE}, "candidats": []}
+
+    @property
+    def pret(self):
+        return self.principal is not None and self.principal.chargeur.pret
+
+    def charger(self):
+        """Charge (ou recharge) toute la configuration puis la publie d'un coup."""
+        with self.verrou_rechargement:
+            self._charger()
+        return self.etat()
+
+    def _charger(self):
+        # Appelé avec verrou_rechargement
+        signature = self._signature_config()
+        config = self._config()
+        principal = VersionModele(config["principal"]["nom"], config["principal"]["chemin"]).charger()
+
+        candidats = []
+        for candidat in config.get("candidats", []):
+            try:
+                candidats.append(VersionModele(
+                    candidat["nom"], candidat["chemin"],
+                    part=candidat.get("part", 0.0), mode=candidat.get("mode", "routage")
+                ).charger())
+            except Exception as e:
+                # Un candidat défaillant n'empêche pas de servir le principal
+                logger.warning("Candidat %s ignoré : %s", candidat.get("nom"), e)
+
+        with self.verrou:
+            self.principal, self.candidats = principal, candidats
+            self.signature_config = signature
+
+    def chemin_principal(self):
+        """Chemin du modèle principal, sans le charger (jobs du pool de processus)."""
+        if self.principal is not None:
+            return self.principal.chemin
+        return self._config()["principal"]["chemin"]
+
+    def verifier_artefacts(self):
+        """Recharge si un artefact, la configuration ou la génération ont changé."""
+        if self.principal is None:
+            # Rien de chargé : le premier usage lira l'état actuel
+            return False
+        versions = [self.principal] + self.candidats
+        change = self._signature_config() != self.signature_config or any(
+            os.path.exists(v.chemin) and empreinte_fichier(v.chemin) != v.empreinte for v in versions
+        )
+        if change:
+            logger.info("Artefact modifié, rechargement du registre")
+            self.charger()
+        return change
+
+    async def _surveiller(self):
+        while True:
+            await asyncio.sleep(SURVEILLANCE_S)
+            try:
+                await run_in_threadpool(self.verifier_artefacts)
+            except Exception as e:
+                # Artefact en cours d'écriture ou invalide : la version servie reste en place
+                logger.warning("Vérification des artefacts en échec : %s", e)
+
+    def demarrer_surveillance(self):
+        """Lance la vérification périodique dans la boucle courante, une seule fois par processus."""
+        if SURVEILLANCE_S > 0 and self.surveillance is None:
+            self.surveillance = asyncio.get_running_loop().create_task(self._surveiller())
+
+    def version_principale(self):
+        """Version principale, chargée une seule fois même sous requêtes concurrentes."""
+        if self.principal is None:
+            with self.verrou_rechargement:
+                # Le chargement de démarrage a pu aboutir pendant l'attente du verrou
+                if self.principal is None:
+                    self._charger()
+        return self.principal
+
+    def choisir(self):
+        """Version qui répondra à cette requête (principal ou candidat en routage)."""
+        self.version_principale()
+        with self.verrou:
+            principal, candidats = self.principal, self.candidats
+
+        tirage = random.random()
+        cumul = 0.0
+        for candidat in candidats:
+            if candidat.mode == "routage":
+                cumul += candidat.part
+                if tirage < cumul:
+                    return candidat
+        return principal
+
+    def ombre(self, X, labels_servis, version_servie, fonction):
+        """Planifie le scoring en ombre ; ne bloque jamais la requête."""
+        with self.verrou:
+            ombres = [c for c in self.candidats if c.mode == "ombre" and c is not version_servie]
+        for version in ombres:
+            with self.verrou:
+                if self.ombre_en_attente >= MAX_OMBRE_EN_ATTENTE:
+                    OMBRE_ABANDONS.incrementer(modele=version.nom)
+                    continue
+                self.ombre_en_attente += 1
+            self.executeur_ombre.submit(self._scorer_ombre, version, X, labels_servis, fonction)
+
+    def _scorer_ombre(self, version, X, labels_servis, fonction):
+        try:
+            labels, _, _ = mesurer(version, "ombre", fonction, X)
+            DESACCORDS_OMBRE.incrementer(
+                int(np.count_nonzero(np.asarray(labels) != np.asarray(labels_servis))), modele=version.nom
+            )
+        except Exception as e:
+            logger.warning("Scoring en ombre de %s en échec : %s", version.nom, e)
+        finally:
+            with self.verrou:
+                self.ombre_en_attente -= 1
+
+    def etat(self):
+        with self.verrou:
+            return {
+                "pret": self.pret,
+                "principal": None if self.principal is None else self.principal.etat(),
+                "candidats": [c.etat() for c in self.candidats]
+            }
+
+
+REGISTRE = RegistreModeles()
+
+# Routes d'administration du registre
+routeur_modeles = APIRouter()
+
+
+@routeur_modeles.get("/models")
+async def lister_modeles():
+    return REGISTRE.etat()
+
+
+@routeur_modeles.post("/models/reload")
+async def recharger_modeles():
+    """
+    Recharge artefacts et configuration sans interrompre les requêtes en
+    cours ; les autres workers suivent à leur prochaine vérification.
+    """
+    try:
+        await run_in_threadpool(REGISTRE.signaler_rechargement)
+        return await run_in_threadpool(REGISTRE.charger)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
@@ -0,0 +1,24 @@
+"""
+Service unique : prédiction et monitoring dans la même application.
+
+    uvicorn service:app
+
+Les routes de l'API et du monitoring sont montées telles quelles, sauf les
+routes d'état du monitoring (routeur_statut) dont les chemins existent déjà
+côté API : elles sont montées sous /monitoring (/monitoring/cache/stats,
+/monitoring/ready, /monitoring/health). /metrics n'est monté qu'une fois,
+par l'API. Les deux services partagent alors le même registre de modèles,
+donc un POST /models/reload s'applique aux deux d'un coup.
+"""
+from fastapi import FastAPI
+from fastapi.exceptions import RequestValidationError
+
+import api
+import monitoring
+from metrics import erreur_validation
+
+app = FastAPI()
+app.add_exception_handler(RequestValidationError, erreur_validation)
+app.include_router(api.app.router)
+app.include_router(monitoring.routeur_monitoring)
+app.include_router(monitoring.routeur_statut, prefix="/monitoring")
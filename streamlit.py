@@ -112,7 +112,12 @@ if uploaded_file is not None:
                 response = requests.post(API_URL, files=files)
 
                 if response.status_code != 200:
-                    st.error(f"Erreur API: {response.status_code}")
+                    # L'API renvoie {"error": ...} avec un code 4xx/5xx
+                    try:
+                        message = response.json().get("error")
+                    except ValueError:
+                        message = None
+                    st.error(message or f"Erreur API: {response.status_code}")
                 else:
                     data = response.json()
                     if "error" in data: